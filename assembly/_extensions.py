@@ -7,21 +7,29 @@ import os
 import re
 import six
 import copy
+import gzip
+import zlib
+import jinja2
+import hashlib
 import logging
 import markdown
 import flask_s3
+import threading
 import flask_mail
 import ses_mailer
 import flask_login
 import flask_kvsession
 from jinja2 import Markup
+from .response import caching, RESPONSE_CACHE_TIMEOUT
 from jinja2.ext import Extension
 from urllib.parse import urlparse
+from jinja2 import nodes
 from jinja2.nodes import CallBlock
 from jinja2 import TemplateSyntaxError
-from . import (ext, config, app_context, utils)
+from . import (Assembly, ext, config, app_context, utils, about)
 from jinja2.lexer import Token, describe_token
-from flask import (request, current_app, send_file, session)
+from flask import (request, current_app, send_file, session, g,
+                   has_request_context)
 
 # ------------------------------------------------------------------------------
 @app_context
@@ -302,12 +310,7 @@ class JinjaMDTagExt(Extension):
     </div>
     """
     tags = set(['markdown'])
-
-    def __init__(self, environment):
-        super(JinjaMDTagExt, self).__init__(environment)
-        environment.extend(
-            markdowner=markdown.Markdown(extensions=['extra'])
-        )
+    md_extensions = ['extra']
 
     def parse(self, parser):
         lineno = next(parser.stream).lineno
@@ -315,6 +318,13 @@ class JinjaMDTagExt(Extension):
             ['name:endmarkdown'],
             drop_needle=True
         )
+
+        # A block with only text is converted once, when the template compiles
+        block = self._get_static_block(body)
+        if block is not None:
+            block = self._render_markdown(self._strip_whitespace(block))
+            return nodes.Output([nodes.TemplateData(block)]).set_lineno(lineno)
+
         return CallBlock(
             self.call_method('_markdown_support'),
             [],
@@ -322,6 +332,20 @@ class JinjaMDTagExt(Extension):
             body
         ).set_lineno(lineno)
 
+    def _get_static_block(self, body):
+        """
+        Return the text of the block if it has no dynamic nodes, otherwise None
+        """
+        parts = []
+        for node in body:
+            if not isinstance(node, nodes.Output):
+                return None
+            for child in node.nodes:
+                if not isinstance(child, nodes.TemplateData):
+                    return None
+                parts.append(child.data)
+        return ''.join(parts)
+
     def _markdown_support(self, caller):
         block = caller()
         block = self._strip_whitespace(block)
@@ -345,8 +369,7 @@ class JinjaMDTagExt(Extension):
         return output.strip()
 
     def _render_markdown(self, block):
-        block = self.environment.markdowner.convert(block)
-        return block
+        return md_to_html(block, extensions=self.md_extensions)
 
 
 class JinjaMDExt(Extension):
@@ -364,22 +387,59 @@ class JinjaMDExt(Extension):
 
 
 # Markdown
-mkd = markdown.Markdown(extensions=[
+# markdown.Markdown instances are not thread-safe, each thread has its own
+# converters, one per set of extensions.
+# Converted texts are kept in a LRU cache, keyed by the hash of the content.
+# The size of the cache can be set with the config MARKDOWN_CACHE_SIZE, 0 to disable
+MD_EXTENSIONS = (
     'markdown.extensions.extra',
     'markdown.extensions.nl2br',
     'markdown.extensions.sane_lists',
     'markdown.extensions.toc'
-])
+)
+_md_local = threading.local()
+_md_cache = utils.LRUCache(maxsize=256)
+
 
+def _get_markdown_converter(extensions):
+    """
+    Return the markdown converter of the current thread for the extensions
+    :param extensions: tuple
+    :return: markdown.Markdown
+    """
+    converters = getattr(_md_local, "converters", None)
+    if converters is None:
+        converters = _md_local.converters = {}
+    mkd = converters.get(extensions)
+    if mkd is None:
+        mkd = converters[extensions] = markdown.Markdown(extensions=list(extensions))
+    return mkd
 
-def md_to_html(text):
+
+def md_to_html(text, extensions=None):
     '''
     Convert MD text to HTML
     :param text:
+    :param extensions: list of markdown extensions. Default: MD_EXTENSIONS
     :return:
     '''
-    mkd.reset()
-    return mkd.convert(text)
+    extensions = tuple(extensions or MD_EXTENSIONS)
+    key = (extensions, hashlib.sha1(text.encode("utf-8")).hexdigest())
+    html = _md_cache.get(key)
+    if html is None:
+        mkd = _get_markdown_converter(extensions)
+        mkd.reset()
+        html = mkd.convert(text)
+        _md_cache.set(key, html)
+    return html
+
+
+def markdown_cache_stats():
+    """
+    Return the stats of the markdown cache
+    :return: dict - hits, misses, hit_rate, size, maxsize
+    """
+    return _md_cache.stats()
 
 
 @app_context
@@ -387,12 +447,14 @@ def setup_markdown(app):
     """
     Load markdown extension
     """
+    _md_cache.resize(app.config.get("MARKDOWN_CACHE_SIZE", 256))
     app.jinja_env.add_extension(JinjaMDTagExt)
     app.jinja_env.add_extension(JinjaMDExt)
 
 
 # The extension
 ext.markdown = md_to_html
+ext.markdown_cache_stats = markdown_cache_stats
 
 # --------
 
@@ -433,6 +495,8 @@ class StreamProcessContext(object):
         self.stream = stream
         self.token = None
         self.stack = []
+        # number of isolated elements in the stack
+        self.isolated = 0
 
     def fail(self, message):
         raise TemplateSyntaxError(message, self.token.lineno, self.stream.name,
@@ -464,11 +528,14 @@ class HTMLCompress(Extension):
         (['dd', 'dt'], set(['dl', 'dt', 'dd']))
     ])
 
-    def is_isolated(self, stack):
-        for tag in reversed(stack):
-            if tag in self.isolated_elements:
-                return True
-        return False
+    def push_tag(self, tag, ctx):
+        ctx.stack.append(tag)
+        if tag in self.isolated_elements:
+            ctx.isolated += 1
+
+    def pop_tag(self, ctx):
+        if ctx.stack.pop() in self.isolated_elements:
+            ctx.isolated -= 1
 
     def is_breaking(self, tag, other_tag):
         breaking = self.breaking_rules.get(other_tag)
@@ -479,43 +546,46 @@ class HTMLCompress(Extension):
         while ctx.stack and self.is_breaking(tag, ctx.stack[-1]):
             self.leave_tag(ctx.stack[-1], ctx)
         if tag not in self.void_elements:
-            ctx.stack.append(tag)
+            self.push_tag(tag, ctx)
 
     def leave_tag(self, tag, ctx):
         if not ctx.stack:
             ctx.fail(
                 'Tried to leave "%s" but something closed it already' % tag)
         if tag == ctx.stack[-1]:
-            ctx.stack.pop()
+            self.pop_tag(ctx)
             return
         for idx, other_tag in enumerate(reversed(ctx.stack)):
             if other_tag == tag:
                 for num in range(idx + 1):
-                    ctx.stack.pop()
+                    self.pop_tag(ctx)
             elif not self.breaking_rules.get(other_tag):
                 break
 
     def normalize(self, ctx):
         pos = 0
         buffer = []
+        append = buffer.append
+        normalize_ws = gl_ws_normalize_re.sub
+        data = ctx.token.value
 
-        def write_data(value):
-            if not self.is_isolated(ctx.stack):
-                value = gl_ws_normalize_re.sub(' ', value)
-            buffer.append(value)
-
-        for match in gl_tag_re.finditer(ctx.token.value):
+        for match in gl_tag_re.finditer(data):
             closes, tag, sole = match.groups()
-            preamble = ctx.token.value[pos:match.start()]
-            write_data(preamble)
+            start = match.start()
+            if start > pos:
+                preamble = data[pos:start]
+                append(preamble if ctx.isolated else normalize_ws(' ', preamble))
             if sole:
-                write_data(sole)
+                # '>' followed by whitespace
+                append(sole if ctx.isolated or len(sole) == 1
+                       else normalize_ws(' ', sole))
             else:
-                buffer.append(match.group())
+                append(match.group())
                 (closes and self.leave_tag or self.enter_tag)(tag, ctx)
             pos = match.end()
 
-        write_data(ctx.token.value[pos:])
+        data = data[pos:]
+        append(data if ctx.isolated else normalize_ws(' ', data))
         return ''.join(buffer)
 
     def filter_stream(self, stream):
@@ -559,10 +629,201 @@ class SelectiveHTMLCompress(HTMLCompress):
             next(stream)
 
 
+"""
+  -- Output minifier
+
+    HTMLCompress only works on the template data at compile time. The
+    whitespace of the dynamic output (variables, markdown...) can be collapsed
+    when the response is sent, by setting the config COMPRESS_HTML_OUTPUT = True
+
+    It keeps pre, textarea, script, style and noscript as is.
+"""
+
+gl_minify_isolated_re = re.compile(
+    r'(<(?:pre|textarea|script|style|noscript)\b.*?'
+    r'</(?:pre|textarea|script|style|noscript)\s*>)', re.S | re.I)
+gl_minify_ws_re = re.compile(r'[\t\r\n][ \t\r\n]*| [ \t\r\n]+')
+
+
+def minify_html(html):
+    """
+    Collapse the whitespace of HTML, outside of isolated elements
+    :param html: string
+    :return: string
+    """
+    parts = gl_minify_isolated_re.split(html)
+    # isolated elements are at the odd positions
+    parts[::2] = [gl_minify_ws_re.sub(' ', part) for part in parts[::2]]
+    return ''.join(parts)
+
+
+def _minify_html_response(response):
+    if response.mimetype == "text/html" \
+            and not response.is_streamed \
+            and not response.direct_passthrough:
+        response.set_data(minify_html(response.get_data(as_text=True)))
+    return response
+
+
 @app_context
 def setup_compress_html(app):
     if app.config.get("COMPRESS_HTML"):
         app.jinja_env.add_extension(HTMLCompress)
+    if app.config.get("COMPRESS_HTML_OUTPUT"):
+        Assembly._ext.add(_minify_html_response)
+
+# ------------------------------------------------------------------------------
+# Response compression
+
+"""
+Responses are compressed with gzip, deflate, or br when `brotli` is installed,
+negotiated with the request Accept-Encoding. Set with the config:
+
+COMPRESS_RESPONSE = {
+    "ENABLED": True,
+    # Responses smaller than this size, in bytes, are sent as is
+    "MIN_SIZE": 500,
+    # Compression level, 1-9
+    "LEVEL": 6,
+    # Content types to compress
+    "MIMETYPES": ["text/html", "application/json", ...]
+}
+
+Streamed, passthrough, already encoded and 'Cache-Control: no-transform'
+responses are not compressed.
+The compressed body of @response.cache responses is saved in the cache, so a
+cache hit doesn't compress it again.
+"""
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIMETYPES = ["text/html",
+                      "text/css",
+                      "text/xml",
+                      "text/plain",
+                      "text/javascript",
+                      "application/json",
+                      "application/javascript",
+                      "application/xml",
+                      "image/svg+xml"]
+
+_compressors = {
+    "gzip": lambda data, level: gzip.compress(data, compresslevel=level, mtime=0),
+    "deflate": lambda data, level: zlib.compress(data, level),
+}
+if brotli:
+    _compressors["br"] = lambda data, level: brotli.compress(data, quality=level)
+
+# In order of preference, when the client accepts them equally
+_compress_encodings = [e for e in ("br", "gzip", "deflate") if e in _compressors]
+
+
+def compress(data, encoding, level=6):
+    """
+    Compress data
+    :param data: bytes
+    :param encoding: str - gzip, deflate or br
+    :param level: int - the compression level
+    :return: bytes
+    """
+    return _compressors[encoding](data, level)
+
+
+def _compress_response(response):
+    app_config = current_app.config
+    if response.status_code != 200 \
+            or response.is_streamed \
+            or response.direct_passthrough \
+            or "Content-Encoding" in response.headers \
+            or response.mimetype not in app_config.get("COMPRESS_RESPONSE_MIMETYPES", COMPRESS_MIMETYPES) \
+            or response.cache_control.no_transform:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(_compress_encodings)
+    if not encoding:
+        return response
+    data = response.get_data()
+    if len(data) < app_config.get("COMPRESS_RESPONSE_MIN_SIZE", 500):
+        return response
+
+    level = app_config.get("COMPRESS_RESPONSE_LEVEL", 6)
+    cache_timeout = g.get(RESPONSE_CACHE_TIMEOUT)
+    if cache_timeout is None:
+        compressed = compress(data, encoding, level)
+    else:
+        key = "asm/compressed/%s/%s" % (encoding, hashlib.sha1(data).hexdigest())
+        compressed = caching.get(key)
+        if compressed is None:
+            compressed = compress(data, encoding, level)
+            caching.set(key, compressed, timeout=cache_timeout)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    # the body changed, a strong ETag becomes weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+@app_context
+def setup_compress_response(app):
+    utils.flatten_config_property("COMPRESS_RESPONSE", app.config)
+    if app.config.get("COMPRESS_RESPONSE_ENABLED"):
+        app.after_request(_compress_response)
+
+# ------------------------------------------------------------------------------
+# Templates bytecode cache
+
+"""
+Compiled templates are kept in a bytecode cache, so workers don't have to
+compile them again. The cache is set with the config TEMPLATES_CACHE:
+
+TEMPLATES_CACHE = {
+    # None, 'filesystem' or 'cache' to use the CACHE backend
+    "TYPE": "filesystem",
+    # For 'filesystem', the directory to save the compiled templates
+    "DIR": "/data/templates-cache",
+    # For 'cache', the timeout in seconds. None doesn't expire
+    "TIMEOUT": None
+}
+
+Templates can be compiled ahead on deploy with `asm gen:compile-templates`
+"""
+
+
+@app_context
+def setup_templates_cache(app):
+    utils.flatten_config_property("TEMPLATES_CACHE", app.config)
+    cache_type = app.config.get("TEMPLATES_CACHE_TYPE")
+    if not cache_type:
+        return
+
+    # Bytecode depends on the extensions the templates are compiled with
+    fingerprint = "%s_%s" % (about.__version__,
+                             "c" if app.config.get("COMPRESS_HTML") else "n")
+    cache_type = cache_type.lower()
+    if cache_type == "filesystem":
+        cache_dir = app.config.get("TEMPLATES_CACHE_DIR")
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        bcc = jinja2.FileSystemBytecodeCache(
+            directory=cache_dir or None,
+            pattern="__asm_%s_%%s.cache" % fingerprint)
+    elif cache_type == "cache":
+        bcc = jinja2.MemcachedBytecodeCache(
+            client=caching,
+            prefix="asm/templates/%s/" % fingerprint,
+            timeout=app.config.get("TEMPLATES_CACHE_TIMEOUT"),
+            ignore_memcache_errors=True)
+    else:
+        raise ValueError("Invalid TEMPLATES_CACHE_TYPE '%s'. "
+                         "Must be 'filesystem' or 'cache'" % cache_type)
+    app.jinja_env.bytecode_cache = bcc
 
 # ------------------------------------------------------------------------------
 
@@ -575,7 +836,22 @@ This is especially useful for css and javascript.
 Your sub-templates can now define css and Javascript files 
 to be included, and the css will be nicely put at the top and 
 the Javascript to the bottom, just like you should. 
-It will also ignore any duplicate content in a single block.
+It will also ignore any duplicate content in a single block, and keep
+the order the contents were added.
+
+The blocks are kept for one render only, they are not shared between
+requests or templates renders.
+{% renderblock %} can be placed before the {% addtoblock %}, ie: in the
+<head>, it is filled once the whole template is rendered. 
+Streamed templates only render what was added so far.
+
+Preload Link headers:
+With the config PRELOAD_LINK_HEADERS = True, the stylesheets and scripts
+of the rendered blocks are also sent in the headers of the html response,
+ie: `Link: </css/style.css>; rel=preload; as=style`, so the browser can
+fetch them before it parses the page.
+The links are cached by the contents of the blocks, so a page rendering
+the same assets doesn't parse them again.
 
 <html>
     <head>
@@ -604,29 +880,193 @@ It will also ignore any duplicate content in a single block.
 """
 
 
+_PLACEHOLDERS_KEY = "__ASM_PLACEHOLDERS__"
+# The blocks of the renders in progress in the thread, the current one last.
+# Imported macros don't share the context of the render, they get the blocks here
+_placeholders_local = threading.local()
+_preload_links_cache = utils.LRUCache(256)
+_preload_tag_re = re.compile(r'<(link|script)\b([^>]*)>', re.IGNORECASE)
+_preload_attr_re = re.compile(r'\b(href|src|rel)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))',
+                              re.IGNORECASE)
+
+
 @app_context
 def init_app(app):
     app.jinja_env.add_extension(PlaceholderAddTo)
     app.jinja_env.add_extension(PlaceholderRender)
-    app.jinja_env.placeholder_tags = {}
+    app.jinja_env.template_class = PlaceholderTemplate
+    app.after_request(_placeholders_after_request)
+
+
+class _PlaceholderBlocks(object):
+    """
+    The placeholder blocks of one render.
+    Each block keeps its contents in the order they were added, without duplicates.
+    When deferred, the rendered blocks are markers, replaced by the blocks
+    with `fill` once the whole template is rendered.
+    While recording (a {% cache %} fragment being rendered), the additions
+    and the rendered blocks are also kept in the recordings, and the
+    rendered blocks are always markers
+    """
+    marker = "<!--asm:placeholder:%s-->"
+    marker_re = re.compile(r"<!--asm:placeholder:(.*?)-->")
+
+    def __init__(self, deferred=False):
+        self.deferred = deferred
+        self.blocks = {}
+        self.rendered = []
+        self.recordings = []
+
+    def add(self, name, content):
+        self.blocks.setdefault(name, {})[content] = None
+        for recording in self.recordings:
+            recording.append((name, content))
+
+    def get(self, name):
+        return list(self.blocks.get(name, ()))
+
+    def render(self, name):
+        if self.recordings:
+            return self.marker % name
+        if self.deferred:
+            if name not in self.rendered:
+                self.rendered.append(name)
+            return self.marker % name
+        return '\n'.join(self.get(name))
+
+    def record(self):
+        """
+        Start recording the additions
+        :return: list - the additions, as (name, content)
+        """
+        recording = []
+        self.recordings.append(recording)
+        return recording
+
+    def stop_recording(self, recording):
+        self.recordings.remove(recording)
+
+    def split(self, html):
+        """
+        Split a html rendered while recording on its rendered blocks
+        :return: list - the html parts at the even indexes, the block names between
+        """
+        return self.marker_re.split(html)
+
+    def join(self, parts):
+        """
+        Render the parts returned by `split` with the current blocks
+        """
+        return "".join(part if i % 2 == 0 else self.render(part)
+                       for i, part in enumerate(parts))
+
+    def fill(self, data):
+        for name in self.rendered:
+            data = data.replace(self.marker % name, '\n'.join(self.get(name)))
+        return data
+
+    def preload_links(self):
+        """
+        Return the preload links of the rendered blocks
+        :return: list
+        """
+        key = tuple((name, tuple(self.blocks.get(name, ()))) for name in self.rendered)
+        links = _preload_links_cache.get(key)
+        if links is None:
+            links = get_preload_links('\n'.join('\n'.join(c) for _, c in key))
+            _preload_links_cache.set(key, links)
+        return links
+
+
+def get_preload_links(html):
+    """
+    Return the preload links of the stylesheets and scripts in a html
+    :param html: str
+    :return: list - ie: ['</css/style.css>; rel=preload; as=style']
+    """
+    links = []
+    for tag, attrs in _preload_tag_re.findall(html):
+        attrs = {k.lower(): (v1 or v2 or v3) for k, v1, v2, v3 in _preload_attr_re.findall(attrs)}
+        if tag.lower() == "script":
+            url, as_ = attrs.get("src"), "script"
+        elif "stylesheet" in attrs.get("rel", "").lower().split():
+            url, as_ = attrs.get("href"), "style"
+        else:
+            continue
+        if url and not url.startswith("data:"):
+            link = "<%s>; rel=preload; as=%s" % (url, as_)
+            if link not in links:
+                links.append(link)
+    return links
+
+
+class PlaceholderTemplate(jinja2.Template):
+    """
+    Template with deferred placeholder blocks, filled when the render is done.
+    In a request, the rendered blocks are kept in g for the preload links.
+    Streamed templates don't go through `render`, their blocks are not deferred
+    """
+    def render(self, *args, **kwargs):
+        vars = dict(*args, **kwargs)
+        blocks = vars[_PLACEHOLDERS_KEY] = _PlaceholderBlocks(deferred=True)
+        stack = getattr(_placeholders_local, "stack", None)
+        if stack is None:
+            stack = _placeholders_local.stack = []
+        stack.append(blocks)
+        try:
+            html = super(PlaceholderTemplate, self).render(vars)
+        finally:
+            stack.pop()
+        if not blocks.rendered:
+            return html
+        if has_request_context():
+            g.setdefault(_PLACEHOLDERS_KEY, []).append(blocks)
+        return blocks.fill(html)
+
+
+def _get_placeholders(context):
+    """
+    Return the placeholder blocks of the current render.
+    In a macro imported by the template, the ones of the render in progress.
+    When not set by PlaceholderTemplate, they are created on the first use
+    """
+    blocks = context.get(_PLACEHOLDERS_KEY)
+    if blocks is None:
+        stack = getattr(_placeholders_local, "stack", None)
+        if stack:
+            return stack[-1]
+        blocks = context.vars[_PLACEHOLDERS_KEY] = _PlaceholderBlocks()
+    return blocks
+
+
+def _placeholders_after_request(response):
+    """
+    Add the preload Link headers of the blocks rendered in the request
+    """
+    blocks = g.pop(_PLACEHOLDERS_KEY, None)
+    if blocks \
+            and current_app.config.get("PRELOAD_LINK_HEADERS") \
+            and response.mimetype == "text/html" \
+            and not response.direct_passthrough:
+        links = []
+        for b in blocks:
+            links.extend(l for l in b.preload_links() if l not in links)
+        if links:
+            response.headers.add("Link", ", ".join(links))
+    return response
 
 
 class PlaceholderAddTo(Extension):
     tags = set(['addtoblock'])
-    def _render_tag(self, name, caller):
-        context = self.environment.placeholder_tags
-        blocks = context.get(name)
-        if blocks is None:
-            blocks = set()
-        blocks.add(caller().strip())
-        context[name] = blocks
+    def _render_tag(self, context, name, caller):
+        _get_placeholders(context).add(name, caller().strip())
         return Markup("")
 
     def parse(self, parser):
         lineno = next(parser.stream).lineno
         name = parser.parse_expression()
         body = parser.parse_statements(['name:endaddtoblock'], drop_needle=True)
-        args = [name]
+        args = [nodes.ContextReference(), name]
         return CallBlock(self.call_method('_render_tag', args),
                          [], [], body).set_lineno(lineno)
 
@@ -634,13 +1074,134 @@ class PlaceholderAddTo(Extension):
 class PlaceholderRender(Extension):
     tags = set(['renderblock'])
 
-    def _render_tag(self, name: str, caller):
-        context = self.environment.placeholder_tags
-        return Markup('\n'.join(context.get(name, [])))
+    def _render_tag(self, context, name: str, caller):
+        return Markup(_get_placeholders(context).render(name))
 
     def parse(self, parser):
         lineno = next(parser.stream).lineno
         name = parser.parse_expression()
-        args = [name]
+        args = [nodes.ContextReference(), name]
         return CallBlock(self.call_method('_render_tag', args),
                          [], [], []).set_lineno(lineno)
+
+
+# ------------------------------------------------------------------------------
+
+"""
+FRAGMENT CACHE
+
+To cache a part of a template in the CACHE backend (response.caching).
+Useful for expensive parts shared across pages, ie: sidebar, menus.
+
+{% cache "key", timeout, *vary_by %}...{% endcache %}
+
+- key: the cache key of the fragment
+- timeout: (optional) timeout in seconds. None uses the CACHE default
+- vary_by: (optional) values to vary the key by, ie: the user id, the language
+
+{% cache "sidebar", 300 %}
+    ...
+{% endcache %}
+
+{% cache "user-menu", 60, current_user.id, lang %}
+    ...
+{% endcache %}
+
+The {% addtoblock %} and {% renderblock %} placeholders inside the fragment
+are kept with it, and applied to the page on each render.
+
+Hits and misses can be retrieved with `ext.fragment_cache_stats()`
+"""
+
+_fragment_cache_stats = {"hits": 0, "misses": 0}
+_fragment_cache_lock = threading.Lock()
+
+
+@app_context
+def setup_fragment_cache(app):
+    app.jinja_env.add_extension(JinjaFragmentCacheExt)
+
+
+class JinjaFragmentCacheExt(Extension):
+    tags = set(['cache'])
+    key_prefix = "asm/fragment/"
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        vary_by = []
+        while parser.stream.skip_if('comma'):
+            vary_by.append(parser.parse_expression())
+        args.append(nodes.List(vary_by))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        args.insert(0, nodes.ContextReference())
+        return CallBlock(self.call_method('_cache_support', args),
+                         [], [], body).set_lineno(lineno)
+
+    def _make_key(self, key, vary_by):
+        key = self.key_prefix + str(key)
+        if vary_by:
+            key += "/" + utils.gen_md5(repr(vary_by))
+        return key
+
+    def _cache_support(self, context, key, timeout, vary_by, caller):
+        """
+        The fragment is saved as (parts, additions): the html split on the
+        rendered placeholder blocks, and the {% addtoblock %} made in it.
+        On a hit, the additions are replayed in the blocks of the render
+        """
+        key = self._make_key(key, vary_by)
+        blocks = _get_placeholders(context)
+        fragment = caching.get(key)
+        if not (isinstance(fragment, tuple) and len(fragment) == 2):
+            _count_fragment_cache("misses")
+            recording = blocks.record()
+            try:
+                html = caller()
+            finally:
+                blocks.stop_recording(recording)
+            parts = blocks.split(html)
+            caching.set(key, (parts, recording), timeout=timeout)
+        else:
+            _count_fragment_cache("hits")
+            parts, additions = fragment
+            for name, content in additions:
+                blocks.add(name, content)
+        return Markup(blocks.join(parts))
+
+
+def _count_fragment_cache(name):
+    with _fragment_cache_lock:
+        _fragment_cache_stats[name] += 1
+
+
+def fragment_cache_stats():
+    """
+    Return the hits and misses of the fragment cache
+    :return: dict
+    """
+    with _fragment_cache_lock:
+        stats = dict(_fragment_cache_stats)
+    total = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / total if total else 0.0
+    return stats
+
+
+ext.fragment_cache_stats = fragment_cache_stats
+
+
+# ------------------------------------------------------------------------------
+
+def page_cache_stats():
+    """
+    Return the stats of the page cache, when PAGE_CACHE_ENABLED is True
+    :return: dict - {"hits": int, "misses": int, "hit_rate": float, 
+                     "saved_seconds": float, "size": int} or None
+    """
+    return Assembly._page_cache.stats() if Assembly._page_cache else None
+
+ext.page_cache_stats = page_cache_stats
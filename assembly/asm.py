@@ -4,19 +4,26 @@ Assembly: asm
 Set of helpers and functions. These functions are dependents of some config and setup
 """
 
+import os
 import re
 import six
 import copy
 import blinker
 import logging
 import inspect
+import hashlib
 import datetime
+import tempfile
 import functools
+import mimetypes
 import itsdangerous
 import flask_cloudy
 from passlib.hash import bcrypt
 from . import (app_context, ext, config, utils)
-from flask import (send_file, session, g)
+from libcloud.storage.drivers.local import LocalStorageDriver
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import parse_options_header
+from flask import (send_file, session, g, request, current_app)
 
 __all__ = [
     "signal",
@@ -25,6 +32,7 @@ __all__ = [
     "send_mail",
     "get_file",
     "upload_file",
+    "upload_stream",
     "delete_file",
     "download_file",
     "hash_string",
@@ -176,6 +184,12 @@ def send_mail(to, **kwargs):
 # ------------------------------------------------------------------------------
 # Storage
 storage = flask_cloudy.Storage()
+
+"""
+Size of the chunks read from the request by upload_stream
+"""
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
 @app_context
 def init_storage(app):
     utils.flatten_config_property("STORAGE", app.config)
@@ -234,6 +248,84 @@ def upload_file(file, props=None,  **kw):
     :param kw: extra **kw for upload
     :return: Storage object
     """
+    return storage.upload(file, **_get_upload_props(props, kw))
+
+
+@signal
+def upload_stream(filename=None, props=None, max_size=None, chunk_size=UPLOAD_CHUNK_SIZE, **kw):
+    """
+    Upload the request body to the storage as it's received, in chunks.
+    The body is not parsed nor spooled by werkzeug, so the memory doesn't grow
+    with the file size. The body is the file itself, ie:
+        fetch("/upload/", {method: "PUT", body: file, headers: {"X-File-Name": file.name}})
+
+    The extension is checked before reading the body. The size is checked
+    against `max_size` or the config MAX_CONTENT_LENGTH, with Content-Length
+    first and while reading. On the LOCAL provider, the file is written to
+    a temp file moved in place when complete. The SHA-256 of the file is computed
+    while it's uploaded.
+
+    class Index(Assembly):
+
+        @request.put
+        def upload(self):
+            obj = upload_stream(props="image")
+            return {"url": obj.url, "checksum": obj.checksum}
+
+    # This function emits a signal
+    @asm.upload_stream.post
+    def file_uploaded(result, **kw):
+        ...
+
+    :param filename: the name of the file. By default, from the X-File-Name
+        or the Content-Disposition header
+    :param props: (str) a key available in config.STORAGE_UPLOAD_FILE_PROPS, or dict
+    :param max_size: int - max size in bytes. By default config MAX_CONTENT_LENGTH
+    :param chunk_size: int - size of the chunks read from the request
+    :param kw: extra **kw for upload: name, prefix, extensions, overwrite, public, random_name...
+    :return: Storage object, with `checksum` and `size`
+    :raises: RequestEntityTooLarge, flask_cloudy.InvalidExtensionError
+    """
+    kwargs = _get_upload_props(props, kw)
+
+    if not filename:
+        filename = request.headers.get("X-File-Name")
+    if not filename:
+        _, options = parse_options_header(request.headers.get("Content-Disposition", ""))
+        filename = options.get("filename")
+    if not filename:
+        raise ValueError("Missing the filename of the upload")
+
+    if max_size is None:
+        max_size = current_app.config.get("MAX_CONTENT_LENGTH")
+    if max_size and request.content_length and request.content_length > max_size:
+        raise RequestEntityTooLarge()
+
+    name = _make_upload_name(filename, **kwargs)
+    for k in ["name", "prefix", "extensions", "allowed_extensions", "overwrite", "random_name"]:
+        kwargs.pop(k, None)
+    if "acl" not in kwargs:
+        kwargs["acl"] = "public-read" if kwargs.pop("public", False) else "private"
+    kwargs.pop("public", None)
+    kwargs.setdefault("content_type", mimetypes.guess_type(name)[0] or "application/octet-stream")
+
+    checksum = hashlib.sha256()
+    chunks = _iter_upload_chunks(request.stream, checksum, max_size, chunk_size)
+    if isinstance(storage.driver, LocalStorageDriver):
+        obj = _upload_local_stream(chunks, name)
+    else:
+        obj = flask_cloudy.Object(obj=storage.container.upload_object_via_stream(
+            iterator=chunks, object_name=name, extra=kwargs))
+    obj.checksum = checksum.hexdigest()
+    return obj
+
+
+def _get_upload_props(props, kw):
+    """
+    :param props: (str) a key available in config.STORAGE_UPLOAD_FILE_PROPS, or dict
+    :param kw: dict, to override the props
+    :return: dict
+    """
     kwargs = {}
     if isinstance(props, str):
         conf = config.get("STORAGE_UPLOAD_FILE_PROPS")
@@ -245,8 +337,73 @@ def upload_file(file, props=None,  **kw):
     elif isinstance(props, dict):
         kwargs.update(props)
     kwargs.update(kw)
+    return kwargs
+
+
+def _make_upload_name(filename, name=None, prefix=None, extensions=None, overwrite=False,
+                      random_name=False, allowed_extensions=None, **kw):
+    """
+    The object name of an upload, the same way as storage.upload does it
+    :return: str
+    :raises: flask_cloudy.InvalidExtensionError
+    """
+    extension = flask_cloudy.get_file_extension(filename)
+    allowed_extensions = extensions or allowed_extensions or storage.allowed_extensions
+    if extension.lower() not in allowed_extensions:
+        raise flask_cloudy.InvalidExtensionError("Invalid file extension: '.%s' " % extension)
 
-    return storage.upload(file, **kwargs)
+    if not name:
+        name = utils.gen_uuid_hex() if random_name \
+            else utils.slugify(flask_cloudy.get_file_name(filename).rsplit(".", 1)[0])
+    if not flask_cloudy.get_file_extension(name).strip():
+        name += "." + extension
+    name = name.strip("/").strip()
+    if isinstance(storage.driver, LocalStorageDriver):
+        name = flask_cloudy.secure_filename(name)
+    if prefix:
+        name = prefix.lstrip("/") + name
+    if not overwrite:
+        name = storage._safe_object_name(name)
+    return name
+
+
+def _iter_upload_chunks(stream, checksum, max_size, chunk_size):
+    """
+    Read the stream in chunks, updating the checksum
+    :raises: RequestEntityTooLarge, when more than max_size bytes are read
+    """
+    size = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        size += len(chunk)
+        if max_size and size > max_size:
+            raise RequestEntityTooLarge()
+        checksum.update(chunk)
+        yield chunk
+
+
+def _upload_local_stream(chunks, name):
+    """
+    Write the chunks to a temp file in the LOCAL container, and move it in place
+    when complete, so a failed upload doesn't leave a partial file
+    :return: Storage object
+    """
+    path = os.path.join(storage.driver.base_path, storage.container.name)
+    fd, tmp_file = tempfile.mkstemp(prefix=".upload-", dir=path)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        obj_path = os.path.join(path, name)
+        os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+        os.chmod(tmp_file, 0o664)
+        os.replace(tmp_file, obj_path)
+    finally:
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+    return storage.get(name)
 
 
 @signal
@@ -9,11 +9,13 @@ import re
 import os
 import sys
 import six
+import time
 import jinja2
 import inspect
 import logging
 import werkzeug
 import functools
+import flask_cors
 import arrow as date
 import pkg_resources
 import logging.config
@@ -23,6 +25,7 @@ import werkzeug.exceptions as HTTPError
 from werkzeug.wrappers import BaseResponse
 from werkzeug.exceptions import HTTPException
 from werkzeug.middleware.proxy_fix import ProxyFix
+from urllib.parse import parse_qsl, urlencode
 from werkzeug.routing import (BaseConverter, parse_rule)
 from flask import (Flask,
                    g,
@@ -33,6 +36,8 @@ from flask import (Flask,
                    Response,
                    request,
                    abort,
+                   current_app,
+                   stream_with_context,
                    url_for as f_url_for,
                    redirect as f_redirect)
 
@@ -152,7 +157,9 @@ def url_for(endpoint, **kw):
             endpoint = getattr(endpoint, fn)
 
         if inspect.ismethod(endpoint) or inspect.isfunction(endpoint):
-            _endpoint = _get_action_endpoint(endpoint)
+            _endpoint = _get_endpoint_from_index(endpoint)
+            if not _endpoint:
+                _endpoint = _get_action_endpoint(endpoint)
             if not _endpoint:
                 _endpoint = _make_routename_from_endpoint(endpoint)
     if _endpoint:
@@ -166,8 +173,10 @@ def redirect(endpoint, **kw):
     NB: Altered flask functions
     Redirect allow to redirect dynamically using the classes methods without
     knowing the right endpoint.
-    Expecting all endpoint have GET as method, it will try to pick the first
-    match, based on the endpoint provided or the based on the Rule map_url
+    Expecting all endpoint have GET as method, it will try to pick the
+    endpoint ending with the one provided, ie: "Index.login" will match
+    "views.main.Index.login". If many endpoints end the same way, it
+    will raise an AssemblyError, use a longer endpoint
 
     An endpoint can also be passed along with **kw
 
@@ -188,10 +197,7 @@ def redirect(endpoint, **kw):
         if "/" in endpoint:
             return f_redirect(endpoint)
         else:
-            for r in Assembly._app.url_map.iter_rules():
-                # Can't redirect to POST
-                if 'GET' in r.methods and endpoint in r.endpoint:
-                    endpoint = r.endpoint
+            endpoint = _get_endpoint_from_suffix(endpoint)
 
     return f_redirect(url_for(endpoint, **kw))
 
@@ -222,6 +228,36 @@ set_cookie is a method of the response object.
 """
 __ASM_SET_COOKIES__ = "__ASM_SET_COOKIES__"
 
+"""
+View action
+The proxy keeps the action being dispatched in the g object: 
+(cls, name, template, view_parsers)
+`render` uses it to build the template path of the current action
+"""
+__ASM_VIEW_ACTION__ = "__ASM_VIEW_ACTION__"
+
+"""
+Streamed templates
+Number of template parts to buffer before sending a chunk
+"""
+_STREAM_TEMPLATE_BUFFER = 5
+
+"""
+Page cache
+Header set by @response.page_cache, with the timeout, to mark the response
+to be saved by the PageCache middleware. It's not sent to the client.
+The middleware sets the environ key, so the header is only set behind it
+"""
+__ASM_PAGE_CACHE_HEADER__ = "X-Asm-Page-Cache"
+__ASM_PAGE_CACHE_ENVIRON__ = "assembly.page_cache"
+
+"""
+CORS preflight
+Access-Control-Max-Age sent on the preflight responses when the config
+CORS_MAX_AGE is not set, so browsers don't repeat the preflight on every request
+"""
+_CORS_MAX_AGE = 600
+
 
 def set_cookie(*a, **kw):
     """
@@ -259,11 +295,16 @@ class Assembly(object):
     trailing_slash = True
     assets = None
     _ext = set()
+    _view_parsers = []
     __special_methods = ["get", "put", "patch", "post", "delete", "index"]
     _app = None
     _init_apps = set()
     _template_fsl = {}
     _static_paths = set()
+    _endpoints = {}
+    _endpoints_suffix = {}
+    _page_cache = None
+    _cors_preflights = {}
 
     @classmethod
     def init(cls,
@@ -306,6 +347,27 @@ class Assembly(object):
         if not config:
             config.update(app.config.items())
 
+        # Page cache
+        # Serve the pages marked with @response.page_cache before Flask dispatch
+        # To use it, set config PAGE_CACHE_ENABLED = True
+        utils.flatten_config_property("PAGE_CACHE", app.config)
+        if app.config.get("PAGE_CACHE_ENABLED"):
+            skip_cookies = [app.config.get("SESSION_COOKIE_NAME", "session"),
+                            app.config.get("REMEMBER_COOKIE_NAME", "remember_token")]
+            skip_cookies += app.config.get("PAGE_CACHE_SKIP_COOKIES") or []
+            cls._page_cache = PageCache(app.wsgi_app,
+                                        maxsize=app.config.get("PAGE_CACHE_MAX_SIZE", 1000),
+                                        skip_cookies=skip_cookies)
+            app.wsgi_app = cls._page_cache
+
+        # CORS preflight
+        # Answer the preflight requests of the @request.cors views before Flask dispatch
+        # To bypass it, set config CORS_PREFLIGHT = False
+        utils.flatten_config_property("CORS", app.config)
+        app.config.setdefault("CORS_MAX_AGE", _CORS_MAX_AGE)
+        if app.config.get("CORS_PREFLIGHT", True):
+            app.wsgi_app = CorsPreflight(app.wsgi_app, app, cls._cors_preflights)
+
         # Proxyfix
         # By default it will use PROXY FIX
         # To by pass it, or to use your own, set config
@@ -367,11 +429,12 @@ class Assembly(object):
         _register_application_template(view, view)
 
     @classmethod
-    def render(cls, data={}, __template__=None, **kwargs):
+    def render(cls, data={}, __template__=None, __stream__=False, **kwargs):
         """
         Render the view template based on the class and the method being invoked
         :param data: The context data to pass to the template
         :param __template__: The file template to use. By default it will map the view/classname/action.html
+        :param __stream__: To send the template in chunks as it renders, in a streamed response
         """
 
         # Add some global Assembly data in g, along with APPLICATION DATA
@@ -383,15 +446,22 @@ class Assembly(object):
         for k, v in vars.items():
             setattr(g, k, v)
 
-        # Build the template using the method name being called
+        # Build the template using the method name being called.
+        # Within a routed request, the proxy has set the current action,
+        # otherwise fallback to the caller's frame
         if not __template__:
-            stack = inspect.stack()[1]
-            action_name = stack[3]
-            __template__ = _make_template_path(cls, action_name)
+            action = g.get(__ASM_VIEW_ACTION__)
+            if action and action[0] is cls:
+                __template__ = action[2]
+            else:
+                action_name = sys._getframe(1).f_code.co_name
+                __template__ = _make_template_path(cls, action_name)
 
         data = data or {}
         data.update(kwargs)
 
+        if __stream__:
+            return _stream_template(__template__, data)
         return render_template(__template__, **data)
 
 
@@ -468,6 +538,7 @@ class Assembly(object):
         for name, value in _get_interesting_members(Assembly, cls):
             proxy = cls._make_proxy_method__(name)
             route_name = _make_routename_from_cls(cls, name)
+            endpoints = []
             try:
                 if hasattr(value, "_rule_cache") and name in value._rule_cache:
                     for idx, cached_rule in enumerate(value._rule_cache[name]):
@@ -488,6 +559,7 @@ class Assembly(object):
                         app.add_url_rule(rule, endpoint, proxy,
                                          subdomain=subdomain,
                                          **options)
+                        endpoints.append((endpoint, options.get("methods")))
                 elif name in cls.__special_methods:
                     if name in ["get", "index"]:
                         methods = ["GET"]
@@ -503,6 +575,7 @@ class Assembly(object):
                     app.add_url_rule(rule, route_name, proxy,
                                      methods=methods,
                                      subdomain=subdomain)
+                    endpoints.append((route_name, methods))
 
                 else:
                     methods = value._methods_cache \
@@ -517,10 +590,15 @@ class Assembly(object):
                     app.add_url_rule(rule, route_name, proxy,
                                      subdomain=subdomain,
                                      methods=methods)
+                    endpoints.append((route_name, methods))
             except DecoratorCompatibilityError:
                 raise DecoratorCompatibilityError(
                     "Incompatible decorator detected on %s in class %s" % (name, cls.__name__))
 
+            _register_endpoint(cls, value, route_name, endpoints)
+            if getattr(value, "__cors__", False):
+                _register_cors_preflight(app, endpoints)
+
         # Error Handler
         # To handle error
         # error code: _error_$code, ie: _error_400(), _error_500()
@@ -571,22 +649,46 @@ class Assembly(object):
         for decorator in cls.decorators:
             view = decorator(view)
 
+        # The pipeline is resolved once here, so the proxy doesn't have to
+        # look up the hooks on every request.
+        # before: _before_request(name, **kw), _before_$name(**kw)
+        # after: cls._ext, _after_$name(response), _after_request(name, response)
+        before_chain = []
+        if hasattr(i, "_before_request"):
+            before_chain.append(functools.partial(i._before_request, name))
+        if hasattr(i, "_before_" + name):
+            before_chain.append(getattr(i, "_before_" + name))
+        before_chain = tuple(before_chain)
+
+        after_chain = list(cls._ext)
+        if hasattr(i, "_after_" + name):
+            after_chain.append(getattr(i, "_after_" + name))
+        if hasattr(i, "_after_request"):
+            after_chain.append(functools.partial(i._after_request, name))
+        after_chain = tuple(after_chain)
+
+        # the action being dispatched, so `render` can find its template
+        # without inspecting the stack
+        template = _make_template_path(cls, view.__name__)
+        action = (cls, view.__name__, template, _resolve_view_parsers(cls, view))
+
+        if hasattr(i, "_renderer"):
+            renderer = i._renderer
+        else:
+            def renderer(data):
+                data.setdefault("__template__", template)
+                return i.render(**data)
+
         @functools.wraps(view)
         def proxy(**forgettable_view_args):
             # Always use the global request object's view_args, because they
             # can be modified by intervening function before an endpoint or
             # wrapper gets called. This matches Flask's behavior.
             del forgettable_view_args
+            setattr(g, __ASM_VIEW_ACTION__, action)
 
-            if hasattr(i, "_before_request"):
-                response = i._before_request(name, **request.view_args)
-                if response is not None:
-                    return response
-
-            before_view_name = "_before_" + name
-            if hasattr(i, before_view_name):
-                before_view = getattr(i, before_view_name)
-                response = before_view(**request.view_args)
+            for before in before_chain:
+                response = before(**request.view_args)
                 if response is not None:
                     return response
 
@@ -594,27 +696,13 @@ class Assembly(object):
 
             # You can also return a dict or None, it will pass it to render
             if isinstance(response, dict) or response is None:
-                response = response or {}
-                if hasattr(i, "_renderer"):
-                    response = i._renderer(response)
-                else:
-                    template = _make_template_path(cls, view.__name__)
-                    response.setdefault("__template__", template)
-                    response = i.render(**response)
+                response = renderer(response or {})
 
             if not isinstance(response, Response):
                 response = make_response(response)
 
-            for ext in cls._ext:
-                response = ext(response)
-
-            after_view_name = "_after_" + name
-            if hasattr(i, after_view_name):
-                after_view = getattr(i, after_view_name)
-                response = after_view(response)
-
-            if hasattr(i, "_after_request"):
-                response = i._after_request(name, response)
+            for after in after_chain:
+                response = after(response)
 
             #  set_cookie on the response, which was cached in the g object
             if __ASM_SET_COOKIES__ in g:
@@ -697,6 +785,40 @@ class Assembly(object):
 
 # ------------------------------------------------------------------------------
 
+def _resolve_view_parsers(cls, view):
+    """
+    Return the view parsers of a view, by priority.
+    The auto parsers are used, unless the class or the view opt out with the
+    attribute __view_parsers__: {"include": set, "exclude": set|True}
+    :param cls: the Assembly class
+    :param view: the view method
+    :return: tuple
+    """
+    parsers = Assembly._view_parsers
+    enabled = {fn for _, fn, auto in parsers if auto}
+    for rules in (getattr(cls, "__view_parsers__", None),
+                  getattr(view, "__view_parsers__", None)):
+        if rules:
+            if rules["exclude"] is True:
+                enabled = set()
+            else:
+                enabled -= rules["exclude"]
+            enabled |= rules["include"]
+    return tuple(fn for _, fn, _ in parsers if fn in enabled)
+
+
+def get_view_parsers():
+    """
+    Return the view parsers of the view being dispatched.
+    Outside of an Assembly view, the auto parsers
+    :return: tuple
+    """
+    action = g.get(__ASM_VIEW_ACTION__)
+    if action:
+        return action[3]
+    return tuple(fn for _, fn, auto in Assembly._view_parsers if auto)
+
+
 def apply_function_to_members(cls, fn):
     """
     Apply a function to all the members of a class.
@@ -742,6 +864,91 @@ def _register_view(cls):
             mod = getattr(mod, k)
     setattr(mod, cls.__name__, cls)
 
+def _register_endpoint(cls, fn, route_name, endpoints):
+    """
+    Index the endpoint of a view method, so `url_for` can reverse a method
+    and `redirect` can find a string endpoint without going through the url_map.
+    When a method has many rules, the first GET or POST one is used
+    :param cls: the view class
+    :param fn: the view method, as found in the class
+    :param route_name: the route name of the method
+    :param endpoints: list of tuple (endpoint, methods)
+    """
+    if not endpoints:
+        return
+    endpoints = [(e, [m.upper() for m in methods or ["GET"]])
+                 for e, methods in endpoints]
+    for endpoint, methods in endpoints:
+        if "GET" in methods or "POST" in methods:
+            break
+    else:
+        endpoint = endpoints[0][0]
+    Assembly._endpoints[(cls, fn)] = endpoint
+    Assembly._endpoints[fn] = endpoint
+
+    # Can't redirect to POST, only GET endpoints are indexed by suffix
+    get_endpoints = [e for e, methods in endpoints if "GET" in methods]
+    for e in get_endpoints:
+        _index_endpoint_suffix(e, e)
+    if get_endpoints and route_name not in get_endpoints:
+        _index_endpoint_suffix(route_name, get_endpoints[0])
+
+
+def _register_cors_preflight(app, endpoints):
+    """
+    Precompute the preflight response of the endpoints of a @request.cors view,
+    from the CORS_* config, to be served by the CorsPreflight middleware
+    :param app: the flask app
+    :param endpoints: list of tuple (endpoint, methods)
+    """
+    preflight = _CorsPreflightResponse(flask_cors.core.get_cors_options(app))
+    for endpoint, _ in endpoints:
+        Assembly._cors_preflights[endpoint] = preflight
+
+
+def _index_endpoint_suffix(name, endpoint):
+    """
+    Index all the dotted suffixes of name to the endpoint.
+    ie: "views.main.Index.login" -> "login", "Index.login", "main.Index.login"...
+    :param name: the name to index
+    :param endpoint: the endpoint it resolves to
+    """
+    segments = name.split(".")
+    for i in range(len(segments)):
+        suffix = ".".join(segments[i:])
+        Assembly._endpoints_suffix.setdefault(suffix, set()).add(endpoint)
+
+
+def _get_endpoint_from_suffix(name):
+    """
+    Return the GET endpoint ending with name.
+    An exact endpoint always wins. Unknown names are returned as is.
+    :param name: string
+    :return: string
+    """
+    endpoints = Assembly._endpoints_suffix.get(name)
+    if not endpoints or name in endpoints:
+        return name
+    if len(endpoints) > 1:
+        raise AssemblyError("Ambiguous endpoint '%s'. It matches: %s"
+                            % (name, ", ".join(sorted(endpoints))))
+    return next(iter(endpoints))
+
+
+def _get_endpoint_from_index(action):
+    """
+    Return the endpoint of a view method from the endpoints index
+    :param action: a bound method or the function of the class
+    :return: string or None
+    """
+    fn = getattr(action, "__func__", action)
+    if inspect.ismethod(action):
+        endpoint = Assembly._endpoints.get((type(action.__self__), fn))
+        if endpoint:
+            return endpoint
+    return Assembly._endpoints.get(fn)
+
+
 def _get_action_endpoint(action):
     """
     Return the endpoint base on the view's action
@@ -830,6 +1037,23 @@ def _register_application_template(pkg, prefix):
         Assembly._static_paths.add(static_path)
 
 
+def _stream_template(template_name, context):
+    """
+    Render a template in a streamed response, chunks are sent as the
+    template renders. The request context is kept during the rendering.
+    Headers and cookies must be set before the response is returned.
+    :param template_name: the template
+    :param context: dict
+    :return: Response
+    """
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    template = app.jinja_env.get_or_select_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(_STREAM_TEMPLATE_BUFFER)
+    return Response(stream_with_context(stream), mimetype="text/html")
+
+
 def _make_template_path(cls, method_name):
     _template = _make_routename_from_cls(cls, method_name)
     m = _template.split(".")
@@ -927,17 +1151,308 @@ class _RegexConverter(BaseConverter):
 class _JinjaPrefixLoader(jinja2.PrefixLoader):
     """
     Prefix loader modifier, that will take into account the full path
+
+    The prefixes are split in path segments and put in a trie once, ie:
+    "app.admin" -> {"app": {"admin": {None: loader}}}
+    A template is resolved by walking down its path, the longest prefix wins.
+    Resolved template names are cached.
     """
+    def __init__(self, mapping, delimiter="/"):
+        super(_JinjaPrefixLoader, self).__init__(mapping, delimiter)
+        self._trie = {}
+        self._cache = {}
+        for prefix, loader in mapping.items():
+            node = self._trie
+            for segment in prefix.replace(".", delimiter).split(delimiter):
+                node = node.setdefault(segment, {})
+            node[None] = loader
+
+    def _resolve(self, template):
+        node = self._trie
+        found = None
+        segments = template.split(self.delimiter)
+        for i, segment in enumerate(segments[:-1]):
+            node = node.get(segment)
+            if node is None:
+                break
+            if None in node:
+                found = (node[None], self.delimiter.join(segments[i + 1:]))
+        return found
+
+    def list_templates(self):
+        result = []
+        for prefix, loader in self.mapping.items():
+            prefix = prefix.replace(".", self.delimiter)
+            for template in loader.list_templates():
+                result.append(prefix + self.delimiter + template)
+        return result
+
     def get_loader(self, template):
         try:
-            for prefix in self.mapping.keys():
-                prek = prefix.replace(".", "/") + "/"
-                if template.startswith(prek):
-                    name = template.split(prek, 1)[1]
-                    break
-            else:
-                prefix, name = template.split(self.delimiter, 1)
-            loader = self.mapping[prefix]
-        except (ValueError, KeyError):
+            found = self._cache[template]
+        except KeyError:
+            found = self._cache[template] = self._resolve(template)
+        if found is None:
             raise jinja2.exceptions.TemplateNotFound(template)
-        return loader, name
\ No newline at end of file
+        return found
+
+
+class PageCache(object):
+    """
+    WSGI middleware serving whole cached pages before Flask dispatch, so a
+    hit doesn't go through the routing, the session, CSRF or the view.
+
+    Only GET and HEAD responses marked by the view with @response.page_cache
+    are saved, with a 200 status and without cookies, a private Cache-Control
+    or a Vary header other than Accept-Encoding.
+    Requests with an Authorization header or one of the `skip_cookies`,
+    ie: the session cookie, always go to the app.
+    Pages are keyed by method, host, path, sorted query and Accept-Encoding,
+    and are kept in memory. They can be purged by their Surrogate-Key header.
+    """
+
+    def __init__(self, wsgi_app, maxsize=1000, skip_cookies=("session",)):
+        """
+        :param wsgi_app: the wsgi app
+        :param maxsize: int - the number of pages to keep
+        :param skip_cookies: list - cookie names, when sent the page is not served from cache
+        """
+        self.wsgi_app = wsgi_app
+        self.pages = utils.LRUCache(maxsize)
+        self.skip_cookies = set(skip_cookies)
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0
+
+    def __call__(self, environ, start_response):
+        environ[__ASM_PAGE_CACHE_ENVIRON__] = True
+        key = self._make_key(environ)
+        if key is None:
+            def _start_response(status, headers, exc_info=None):
+                headers = [h for h in headers if h[0] != __ASM_PAGE_CACHE_HEADER__]
+                return start_response(status, headers, exc_info)
+            return self.wsgi_app(environ, _start_response)
+
+        start = time.time()
+        page = self.pages.get(key)
+        if page and page[0] > start:
+            _, status, headers, body, duration, _ = page
+            start_response(status, list(headers))
+            self.hits += 1
+            self.saved += duration - (time.time() - start)
+            return [body]
+
+        self.misses += 1
+        marked = {}
+
+        def _start_response(status, headers, exc_info=None):
+            sent = []
+            for name, value in headers:
+                if name == __ASM_PAGE_CACHE_HEADER__:
+                    marked["timeout"] = int(value)
+                else:
+                    sent.append((name, value))
+            if marked and self._is_cacheable(status, sent):
+                marked.update(status=status, headers=sent)
+            return start_response(status, sent, exc_info)
+
+        app_iter = self.wsgi_app(environ, _start_response)
+        if "status" not in marked:
+            return app_iter
+        return self._iter_and_save(key, app_iter, marked, start)
+
+    def _iter_and_save(self, key, app_iter, marked, start):
+        chunks = []
+        try:
+            for chunk in app_iter:
+                chunks.append(chunk)
+                yield chunk
+            headers = tuple(marked["headers"])
+            surrogate_keys = set()
+            for name, value in headers:
+                if name.lower() == "surrogate-key":
+                    surrogate_keys.update(value.split())
+            self.pages.set(key, (time.time() + marked["timeout"],
+                                 marked["status"],
+                                 headers,
+                                 b"".join(chunks),
+                                 time.time() - start,
+                                 surrogate_keys))
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+    def _make_key(self, environ):
+        method = environ.get("REQUEST_METHOD")
+        if method not in ("GET", "HEAD") or "HTTP_AUTHORIZATION" in environ:
+            return None
+        cookie = environ.get("HTTP_COOKIE")
+        if cookie:
+            names = {c.split("=", 1)[0].strip() for c in cookie.split(";")}
+            if names & self.skip_cookies:
+                return None
+        query = environ.get("QUERY_STRING")
+        if query:
+            query = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+        # ProxyFix runs after the page cache, the forwarded values are not applied yet
+        return (method,
+                environ.get("wsgi.url_scheme"),
+                environ.get("HTTP_X_FORWARDED_PROTO"),
+                environ.get("HTTP_X_FORWARDED_HOST"),
+                environ.get("HTTP_HOST") or environ.get("SERVER_NAME"),
+                environ.get("SCRIPT_NAME", "") + environ.get("PATH_INFO", ""),
+                query,
+                environ.get("HTTP_ACCEPT_ENCODING", ""))
+
+    def _is_cacheable(self, status, headers):
+        if not status.startswith("200"):
+            return False
+        for name, value in headers:
+            name = name.lower()
+            if name == "set-cookie":
+                return False
+            if name == "cache-control" and ("private" in value or "no-store" in value):
+                return False
+            # pages are only keyed by Accept-Encoding
+            if name == "vary" and any(v.strip().lower() not in ("accept-encoding", "")
+                                      for v in value.split(",")):
+                return False
+        return True
+
+    def stats(self):
+        """
+        :return: dict - hits, misses, hit_rate, saved_seconds, size
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_seconds": self.saved,
+            "size": len(self.pages)
+        }
+
+    def purge(self, keys):
+        """
+        Remove the pages tagged with any of the surrogate keys
+        :param keys: list of surrogate keys
+        :return: int - the number of pages removed
+        """
+        keys = set(keys)
+        purged = [k for k, page in self.pages.items() if page[5] & keys]
+        for k in purged:
+            self.pages.delete(k)
+        return len(purged)
+
+    def clear(self):
+        """ Remove all the pages and reset the stats """
+        self.pages.clear()
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0
+
+
+class _CorsPreflightResponse(object):
+    """
+    The preflight response of a @request.cors view. The headers that don't
+    depend on the request are computed once, with the same rules as flask_cors
+    """
+
+    def __init__(self, options):
+        """
+        :param options: dict - the serialized flask_cors options
+        """
+        self.options = options
+        self.methods = set(options["methods"].split(", "))
+        self.headers = [("Access-Control-Allow-Methods", options["methods"])]
+        if options.get("max_age"):
+            self.headers.append(("Access-Control-Max-Age", str(options["max_age"])))
+        if options.get("supports_credentials"):
+            self.headers.append(("Access-Control-Allow-Credentials", "true"))
+        if options.get("expose_headers"):
+            self.headers.append(("Access-Control-Expose-Headers", options["expose_headers"]))
+        origins = options["origins"]
+        self.vary = options.get("vary_header") \
+            and (len(origins) > 1 or any(map(flask_cors.core.probably_regex, origins)))
+
+    def __call__(self, environ):
+        """
+        :param environ: the wsgi environ of the preflight request
+        :return: list of headers, or None when the origin or the method is not allowed
+        """
+        method = environ["HTTP_ACCESS_CONTROL_REQUEST_METHOD"].upper()
+        if method not in self.methods:
+            return None
+        origins = flask_cors.core.get_cors_origins(self.options, environ["HTTP_ORIGIN"])
+        if not origins:
+            return None
+        headers = [("Access-Control-Allow-Origin", o) for o in origins]
+        allow_headers = flask_cors.core.get_allow_headers(
+            self.options, environ.get("HTTP_ACCESS_CONTROL_REQUEST_HEADERS"))
+        if allow_headers:
+            headers.append(("Access-Control-Allow-Headers", allow_headers))
+        headers += self.headers
+        if self.vary and origins != ["*"]:
+            headers.append(("Vary", "Origin"))
+        return headers
+
+
+class CorsPreflight(object):
+    """
+    WSGI middleware answering the CORS preflight requests of the @request.cors
+    views before Flask dispatch, so they don't go through the session,
+    the before/after hooks or the view decorators.
+
+    The responses are precomputed when the views are registered. The endpoint
+    of a path is matched once and kept, repeated preflights skip the routing.
+    Other requests, and preflights with an origin or a method not allowed,
+    go to the app.
+    """
+
+    def __init__(self, wsgi_app, app, preflights, maxsize=1000):
+        """
+        :param wsgi_app: the wsgi app
+        :param app: the flask app, to match the path with its url_map
+        :param preflights: dict - {endpoint: _CorsPreflightResponse}
+        :param maxsize: int - the number of paths to keep
+        """
+        self.wsgi_app = wsgi_app
+        self.app = app
+        self.preflights = preflights
+        self.routes = utils.LRUCache(maxsize)
+
+    def __call__(self, environ, start_response):
+        if environ.get("REQUEST_METHOD") != "OPTIONS" \
+                or "HTTP_ORIGIN" not in environ \
+                or "HTTP_ACCESS_CONTROL_REQUEST_METHOD" not in environ:
+            return self.wsgi_app(environ, start_response)
+
+        route = self._match(environ)
+        headers = route[0](environ) if route else None
+        if headers is None:
+            return self.wsgi_app(environ, start_response)
+        headers += [("Allow", route[1]), ("Content-Length", "0")]
+        start_response("200 OK", headers)
+        return [b""]
+
+    def _match(self, environ):
+        """
+        :return: tuple (_CorsPreflightResponse, allowed methods) or None
+        """
+        key = (environ.get("HTTP_HOST") or environ.get("SERVER_NAME"),
+               environ.get("SCRIPT_NAME", "") + environ.get("PATH_INFO", ""))
+        route = self.routes.get(key, False)
+        if route is not False:
+            return route
+        route = None
+        try:
+            adapter = self.app.url_map.bind_to_environ(
+                environ, server_name=self.app.config.get("SERVER_NAME"))
+            rule, _ = adapter.match(method="OPTIONS", return_rule=True)
+            if rule.endpoint in self.preflights:
+                route = (self.preflights[rule.endpoint],
+                         ", ".join(sorted(rule.methods)))
+        except HTTPException:
+            pass
+        self.routes.set(key, route)
+        return route
@@ -3,12 +3,19 @@
 Assembly: request
 """
 
+import re
+import math
+import time
 import inspect
+import functools
+import threading
 import flask_cors
+import collections
 import flask_seasurf
-from flask import request as f_request
-from .assembly import app_context
 from . import utils
+from werkzeug.exceptions import TooManyRequests
+from .assembly import app_context, apply_function_to_members
+from flask import request as f_request, after_this_request
 
 
 # CSRF
@@ -20,6 +27,160 @@ csrf = flask_seasurf.SeaSurf()
 app_context(csrf.init_app)
 
 
+# Rate limit
+# :decorator
+#   - @request.rate_limit("100/minute")
+# The counters are kept in memory by default, with a token bucket per client.
+# With many processes, set config RATE_LIMIT_STORAGE = "cache" to count in the
+# CACHE backend, ie: redis
+
+"""
+Periods accepted by @request.rate_limit, in seconds
+"""
+RATE_LIMIT_PERIODS = {
+    "second": 1,
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400
+}
+
+_rate_limit_re = re.compile(r"^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$")
+
+
+def _parse_rate_limit(limit):
+    """
+    :param limit: str - ie: "100/minute", "10/second", "1000/6hours"
+    :return: tuple (count, period in seconds)
+    """
+    match = _rate_limit_re.match(limit)
+    if not match:
+        raise ValueError("Invalid rate limit '%s'" % limit)
+    count, num, unit = match.groups()
+    return int(count), int(num or 1) * RATE_LIMIT_PERIODS[unit]
+
+
+class TokenBucket(object):
+    """
+    In process rate limit counters. Each client has a bucket of `limit`
+    tokens, refilled continuously over the period, a request takes one.
+    The least recently seen clients are dropped when there are more than `maxsize`
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.buckets = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def hit(self, key, limit, period):
+        """
+        :param key: str - the client key
+        :param limit: int - the number of requests per period
+        :param period: int - seconds
+        :return: tuple (allowed, remaining, retry_after)
+        """
+        rate = limit / period
+        now = time.monotonic()
+        buckets = self.buckets
+        with self.lock:
+            bucket = buckets.pop(key, None)
+            tokens = limit if bucket is None \
+                else min(limit, bucket[0] + (now - bucket[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            buckets[key] = (tokens, now)
+            if len(buckets) > self.maxsize:
+                buckets.popitem(last=False)
+        return allowed, int(tokens), 0 if allowed else (1 - tokens) / rate
+
+
+class CacheCounter(object):
+    """
+    Rate limit counters in a flask_caching backend, shared by all the processes.
+    Requests are counted per fixed window of the period. With redis,
+    the counter is incremented atomically
+    """
+
+    def __init__(self, cache, prefix="asm/ratelimit/"):
+        """
+        :param cache: flask_caching.Cache
+        :param prefix: str - prefix of the cache keys
+        """
+        self.cache = cache
+        self.prefix = prefix
+
+    def hit(self, key, limit, period):
+        """
+        :param key: str - the client key
+        :param limit: int - the number of requests per period
+        :param period: int - seconds
+        :return: tuple (allowed, remaining, retry_after)
+        """
+        now = time.time()
+        window_key = "%s%s/%d" % (self.prefix, key, now // period)
+        if self.cache.add(window_key, 1, timeout=period):
+            count = 1
+        else:
+            count = self.cache.cache.inc(window_key) or 1
+        allowed = count <= limit
+        return allowed, max(limit - count, 0), 0 if allowed else period - now % period
+
+
+class RateLimiter(object):
+    """
+    Check the requests of the @request.rate_limit views against their limit
+    CONFIG
+        RATE_LIMIT_ENABLED = True
+        RATE_LIMIT_STORAGE = "memory" # or "cache"
+        RATE_LIMIT_HEADERS = True # to send X-RateLimit-Limit and X-RateLimit-Remaining
+        RATE_LIMIT_MAX_CLIENTS = 10000 # clients kept in memory
+    """
+
+    def __init__(self):
+        self.store = TokenBucket()
+        self.enabled = True
+        self.headers = True
+
+    def init_app(self, app):
+        utils.flatten_config_property("RATE_LIMIT", app.config)
+        self.enabled = app.config.get("RATE_LIMIT_ENABLED", True)
+        self.headers = app.config.get("RATE_LIMIT_HEADERS", True)
+        storage = app.config.get("RATE_LIMIT_STORAGE", "memory")
+        if storage == "memory":
+            self.store = TokenBucket(app.config.get("RATE_LIMIT_MAX_CLIENTS", 10000))
+        elif storage == "cache":
+            from .response import caching
+            self.store = CacheCounter(caching)
+        else:
+            raise ValueError("Invalid RATE_LIMIT_STORAGE '%s'" % storage)
+
+    def check(self, scope, limit, period, key=None, store=None):
+        """
+        Count the request of the client
+        :param scope: str - the name of the limit, ie: the view
+        :param limit: int - the number of requests per period
+        :param period: int - seconds
+        :param key: callable - returns the client key. By default the remote address
+        :param store: the counters, by default the app one
+        :raises: TooManyRequests
+        """
+        client = key() if key else f_request.remote_addr
+        allowed, remaining, retry_after = \
+            (store or self.store).hit("%s:%s" % (scope, client), limit, period)
+        if self.headers:
+            @after_this_request
+            def set_headers(response):
+                response.headers["X-RateLimit-Limit"] = str(limit)
+                response.headers["X-RateLimit-Remaining"] = str(remaining)
+                return response
+        if not allowed:
+            raise TooManyRequests(retry_after=int(math.ceil(retry_after)))
+
+
+rate_limiter = RateLimiter()
+app_context(rate_limiter.init_app)
+
+
 class RequestProxy(object):
     """
     A request proxy, that attaches some special attributes to the Flask request object
@@ -61,6 +222,8 @@ class RequestProxy(object):
         Make sure @cors decorator is placed at the top position.
         All response decorators must be placed below. 
         It's because it requires a response to be available
+        The preflight requests are answered by the CorsPreflight middleware,
+        before the view is dispatched
 
         class Index(Assembly):
             def index(self):
@@ -76,8 +239,51 @@ class RequestProxy(object):
         if inspect.isclass(fn):
             raise Error("@cors can only be applied on Assembly methods")
         else:
-            cors_fn = flask_cors.cross_origin(automatic_options=True)
-            return cors_fn(fn)
+            cors_fn = flask_cors.cross_origin(automatic_options=True)(fn)
+            cors_fn.__cors__ = True
+            return cors_fn
+
+    @classmethod
+    def rate_limit(cls, limit, key=None, scope=None, store=None):
+        """
+        Decorator to limit the number of requests of a client to a view.
+        Above the limit, a 429 Too Many Requests is raised with Retry-After,
+        before the view runs. Works on class and methods, each method has 
+        its own limit. Put it above the other decorators.
+
+        class Api(Assembly):
+
+            @request.rate_limit("100/minute")
+            def index(self):
+                ...
+
+            @request.rate_limit("5/hour", key=lambda: current_user.id)
+            def reset_password(self):
+                ...
+
+        :param limit: str - "count/period", ie: "100/minute", "10/second", "1000/6hours"
+        :param key: callable - returns the client key. By default the remote address
+        :param scope: str - the name of the limit. Views with the same scope share it.
+            By default the name of the view
+        :param store: an object with `hit(key, limit, period)`, to count differently
+        :return:
+        """
+        count, period = _parse_rate_limit(limit)
+
+        def decorator(f):
+            if inspect.isclass(f):
+                apply_function_to_members(f, decorator)
+                return f
+
+            _scope = scope or "%s.%s" % (f.__module__, f.__qualname__)
+
+            @functools.wraps(f)
+            def decorated_view(*args, **kwargs):
+                if rate_limiter.enabled:
+                    rate_limiter.check(_scope, count, period, key, store)
+                return f(*args, **kwargs)
+            return decorated_view
+        return decorator
 
     @classmethod
     def get(cls, f):
@@ -4,57 +4,109 @@ Assembly: response
 """
 
 import copy
+import time
 import arrow
 import inspect
+import hashlib
+import logging
+import threading
 import functools
+import itertools
 from . import utils
+import collections.abc
 import flask_caching
 from jinja2 import Markup
-from dicttoxml import dicttoxml
+from flask_login import current_user
 from werkzeug.wrappers import BaseResponse
-from .assembly import (Assembly, app_context, apply_function_to_members)
+from .assembly import (Assembly, app_context, apply_function_to_members,
+                       get_view_parsers, __ASM_PAGE_CACHE_HEADER__,
+                       __ASM_PAGE_CACHE_ENVIRON__)
 from flask import (Response,
                    jsonify,
                    request,
                    current_app,
                    url_for,
                    make_response,
+                   stream_with_context,
+                   copy_current_request_context,
+                   after_this_request,
                    g)
 
 # ----------------------------------------------------------------------------------------------------------------------
-# ----  Monkey patch jsonify, to convert other data type: ie: Arrow
+# ----  Monkey patch jsonify, to use the JSON backend and convert other data type: ie: Arrow
+# The output is the same as Flask's JSONEncoder, ie: dates in HTTP format
 import flask.json
-from flask.json import dumps as flask_dumps
 
+_flask_json_encoder = flask.json.JSONEncoder()
 
-class _JSONEnc(flask.json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, arrow.Arrow):
-            return o.for_json()
-        else:
-            return super(self.__class__, self).default(o)
+
+def _jsonify_default(o):
+    if isinstance(o, arrow.Arrow):
+        return o.for_json()
+    return _flask_json_encoder.default(o)
 
 
 def dumps(o, **kw):
-    kw["cls"] = _JSONEnc
-    return flask_dumps(o, **kw)
+    flask.json._dump_arg_defaults(kw)
+    if kw.get("cls") is flask.json.JSONEncoder:
+        del kw["cls"]
+    return utils.json_dumps(o, default=_jsonify_default, **kw)
 flask.json.dumps = dumps
 
 # ----------------------------------------------------------------------------------------------------------------------
 
 
-__view_parsers = set()
+def view_parser(f=None, priority=100, auto=True):
+    """
+    A decorator to register a function to parse the data that will be 
+    rendered by @json, @xml and the other data renderers.
+    Parsers run by priority, the lowest first.
 
+    @response.view_parser
+    def parser(data):
+        ...
+        return data
 
-def view_parser(f):
-    """
-    A simple decorator to to parse the data that will be rendered
-    :param func:
+    @response.view_parser(priority=10, auto=False)
+    def only_where_asked(data):
+        ...
+        return data
+
+    The parsers of each view are resolved when the views are registered.
+
+    :param f: the parser, when used without arguments
+    :param priority: int - the order to run the parser
+    :param auto: bool - when False, it only runs on the views opting in with @view_parsers
     :return:
     """
-    __view_parsers.add(f)
+    if f is None:
+        return functools.partial(view_parser, priority=priority, auto=auto)
+    Assembly._view_parsers.append((priority, f, auto))
+    Assembly._view_parsers.sort(key=lambda p: p[0])
     return f
 
+def view_parsers(*include, exclude=None):
+    """
+    Decorator to select the view parsers of a class or a method.
+    The rules of the method apply after the ones of the class.
+
+    @response.view_parsers(only_where_asked)
+    @response.view_parsers(exclude=[parser])
+    @response.view_parsers(exclude=True)  # no parsers
+
+    :param include: parsers to opt in
+    :param exclude: list of parsers to opt out, or True for all of them
+    :return:
+    """
+    rules = {
+        "include": set(include),
+        "exclude": True if exclude is True else set(exclude or ())
+    }
+    def decorator(f):
+        f.__view_parsers__ = rules
+        return f
+    return decorator
+
 def _build_response(data, renderer=None):
     """
     Build a response using the renderer from the data
@@ -66,16 +118,113 @@ def _build_response(data, renderer=None):
         raise AttributeError(" Renderer is required")
 
     data, status, headers = utils.prepare_view_response(data)
-    for _ in __view_parsers:
-        data = _(data) 
+    # iterators are streamed row by row, they are not parsed
+    if not isinstance(data, collections.abc.Iterator):
+        for _ in get_view_parsers():
+            data = _(data) 
     return make_response(renderer(data), status, headers)
 
-json_renderer = lambda i, data: _build_response(data, jsonify)
-xml_renderer = lambda i, data: _build_response(data, dicttoxml)
+
+# Number of rows serialized per chunk in streamed json
+_STREAM_JSON_ROWS = 100
+
+
+# The separators of the compact jsonify output
+_JSON_COMPACT = {"indent": None, "separators": (",", ":")}
+
+
+def _get_jsonify_args():
+    """
+    The dumps arguments of jsonify, pretty printed in debug
+    or with JSONIFY_PRETTYPRINT_REGULAR
+    """
+    if current_app.config.get("JSONIFY_PRETTYPRINT_REGULAR") or current_app.debug:
+        return {"indent": 2, "separators": (", ", ": ")}
+    return _JSON_COMPACT
+
+
+def _iter_json_chunks(rows, dumps_args, start="", sep="\n", end="", row_end=""):
+    """
+    Serialize the rows incrementally, by chunks of _STREAM_JSON_ROWS.
+    Each row is serialized as jsonify does, with flask.json.dumps
+    :param rows: iterator
+    :param dumps_args: dict - the arguments of flask.json.dumps
+    :param start: str - sent before the rows
+    :param sep: str - between the rows
+    :param end: str - sent after the rows
+    :param row_end: str - sent after each row
+    :return: generator
+    """
+    yield start
+    first = True
+    while True:
+        chunk = [flask.json.dumps(r, **dumps_args) + row_end
+                 for r in itertools.islice(rows, _STREAM_JSON_ROWS)]
+        if not chunk:
+            break
+        yield ("" if first else sep) + sep.join(chunk)
+        first = False
+    yield end
+
+
+def _stream_json(rows, mimetype, dumps_args, start="", sep="\n", end="", row_end=""):
+    gen = _iter_json_chunks(iter(rows), dumps_args, start, sep, end, row_end)
+    return Response(stream_with_context(gen), mimetype=mimetype)
+
+
+def _jsonify(data):
+    """
+    jsonify, or stream an iterator as a JSON array
+    """
+    if isinstance(data, collections.abc.Iterator):
+        return _stream_json(data, "application/json", _get_jsonify_args(), "[", ",", "]")
+    return jsonify(data)
+
+
+def _ndjsonify(data):
+    """
+    Stream rows as newline delimited JSON, each row ends with a newline.
+    A dict is sent as a single row, no rows is an empty body
+    """
+    if isinstance(data, dict):
+        data = [data]
+    return _stream_json(data, "application/x-ndjson", _JSON_COMPACT, sep="", row_end="\n")
+
+
+def _has_iterator(data):
+    """
+    Tell if there is an iterator or a generator in the data, at any level
+    """
+    stack = [data]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set)):
+            stack.extend(obj)
+        elif isinstance(obj, collections.abc.Iterator):
+            return True
+    return False
+
+
+def _xmlify(data):
+    """
+    The data as XML, the same output as dicttoxml.
+    It's streamed when the data holds an iterator or a generator
+    """
+    if _has_iterator(data):
+        return Response(stream_with_context(utils.iter_xml(data)), mimetype="application/xml")
+    return Response(utils.to_xml(data), mimetype="application/xml")
+
+
+json_renderer = lambda i, data: _build_response(data, _jsonify)
+xml_renderer = lambda i, data: _build_response(data, _xmlify)
 
 def json(func):
     """
-    Decorator to render as JSON
+    Decorator to render as JSON.
+    A generator or an iterator is streamed as a JSON array, without
+    loading all the rows in memory
     :param func:
     :return:
     """
@@ -86,12 +235,37 @@ def json(func):
         @functools.wraps(func)
         def decorated_view(*args, **kwargs):
             data = func(*args, **kwargs)
-            return _build_response(data, jsonify)
+            return _build_response(data, _jsonify)
+        return decorated_view
+
+def ndjson(func):
+    """
+    Decorator to stream rows as newline delimited JSON (application/x-ndjson).
+    The view returns a generator, an iterator or a list of rows, which are 
+    serialized as they are sent. Status and headers can be returned
+    as with other responses, ie: return rows, 200, {"X-Total": "3"}
+
+    @response.ndjson
+    def export(self):
+        return (row.to_dict() for row in query_items())
+
+    :param func:
+    :return:
+    """
+    if inspect.isclass(func):
+        apply_function_to_members(func, ndjson)
+        return func
+    else:
+        @functools.wraps(func)
+        def decorated_view(*args, **kwargs):
+            data = func(*args, **kwargs)
+            return _build_response(data, _ndjsonify)
         return decorated_view
 
 def xml(func):
     """
-    Decorator to render as XML
+    Decorator to render as XML.
+    The XML is streamed as it's written, generators are not loaded in memory
     :param func:
     :return:
     """
@@ -102,7 +276,7 @@ def xml(func):
         @functools.wraps(func)
         def decorated_view(*args, **kwargs):
             data = func(*args, **kwargs)
-            return _build_response(data, dicttoxml)
+            return _build_response(data, _xmlify)
         return decorated_view
 
 def jsonp(func):
@@ -160,6 +334,34 @@ def template(page=None, **kwargs):
             return wrap
     return decorator
 
+def stream(func):
+    """
+    Decorator to render the view template in a streamed response.
+    The page is sent in chunks as the template renders, instead of
+    building the whole page first. Works on class and methods that return dict.
+
+    @response.stream
+    def listing(self):
+        return {"items": query_items()}
+
+    Cookies and headers must be set in the view, before the template renders.
+
+    :param func:
+    :return:
+    """
+    if inspect.isclass(func):
+        apply_function_to_members(func, stream)
+        return func
+    else:
+        @functools.wraps(func)
+        def decorated_view(*args, **kwargs):
+            response = func(*args, **kwargs)
+            if isinstance(response, dict) or response is None:
+                response = response or {}
+                response.setdefault("__stream__", True)
+            return response
+        return decorated_view
+
 def headers(params={}):
     """This decorator adds the headers passed in to the response
     """
@@ -184,6 +386,100 @@ def noindex(f):
     """This decorator passes X-Robots-Tag: noindex"""
     return headers({'X-Robots-Tag': 'noindex'})(f)
 
+
+def conditional(func=None, version=None, last_modified=None):
+    """
+    Decorator to answer conditional GET requests with a 304 Not Modified.
+    Works on class and methods.
+
+    Without arguments, a strong ETag is computed from the response body, the
+    view still runs but the body is not sent when it matches If-None-Match.
+
+    @response.conditional
+    def api(self):
+        ...
+
+    With `version` and/or `last_modified`, functions called with the view
+    arguments, the 304 is returned before the view runs, skipping the
+    template rendering or the json serialization.
+
+    @response.conditional(version=lambda self, id: Post.get(id).updated_at)
+    def post(self, id):
+        ...
+
+    :param func: the view, when used without arguments
+    :param version: callable - returns a value that changes with the content
+    :param last_modified: callable - returns the datetime the content changed
+    :return:
+    """
+    if func is None:
+        return functools.partial(conditional, version=version, last_modified=last_modified)
+
+    if inspect.isclass(func):
+        apply_function_to_members(func, functools.partial(conditional,
+                                                          version=version,
+                                                          last_modified=last_modified))
+        return func
+
+    @functools.wraps(func)
+    def decorated_view(*args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return func(*args, **kwargs)
+
+        if not version and not last_modified:
+            after_this_request(_make_conditional)
+            return func(*args, **kwargs)
+
+        etag, modified = None, None
+        if version:
+            v = str(version(*args, **kwargs)).encode("utf-8")
+            etag = hashlib.sha1(v).hexdigest()
+        if last_modified:
+            modified = last_modified(*args, **kwargs)
+            if isinstance(modified, arrow.Arrow):
+                modified = modified.datetime
+            if modified and modified.tzinfo:
+                modified = arrow.get(modified).to("utc").naive
+
+        def set_validators(response):
+            if response.status_code in (200, 304):
+                if etag:
+                    response.set_etag(etag)
+                if modified:
+                    response.last_modified = modified
+            return response
+
+        if _is_not_modified(etag, modified):
+            return set_validators(Response(status=304))
+        after_this_request(set_validators)
+        return func(*args, **kwargs)
+    return decorated_view
+
+
+def _is_not_modified(etag, modified):
+    """
+    If-None-Match has precedence over If-Modified-Since
+    """
+    if request.if_none_match:
+        return bool(etag) and request.if_none_match.contains_weak(etag)
+    if modified and request.if_modified_since:
+        return modified.replace(microsecond=0) \
+            <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def _make_conditional(response):
+    """
+    Add a strong ETag from the body, and turn the response into a 304
+    if it matches the request
+    """
+    if response.status_code == 200 \
+            and not response.is_streamed \
+            and not response.direct_passthrough:
+        response.add_etag()
+        response.make_conditional(request)
+    return response
+
 # ------------------------------------------------------------------------------
 """
 Caching
@@ -194,13 +490,472 @@ Allow caching in the response
 def cached(self):
     ...
 
+vary_by: a list of rules to vary the cache key by
+    - 'args:page': the query arg `page`
+    - 'header:Accept-Language': a request header
+    - 'cookie:name': a cookie
+    - 'user': the logged in user id
+    - a function, returning the value to vary by
+
+@response.cache(60, vary_by=["args:page", "user"])
+def listing(self):
+    ...
+
+stale_while_revalidate: seconds an expired entry is still served, while it's
+refreshed in the background. Only one request per key recomputes the view at
+a time, using a lock in the cache backend. On a miss, the other requests wait
+for it, up to lock_timeout.
+
+@response.cache(60, stale_while_revalidate=300)
+def homepage(self):
+    ...
 """
 caching = flask_caching.Cache()
 
+# Key in g of the timeout of the @cache entry of the current request
+RESPONSE_CACHE_TIMEOUT = "_asm_response_cache_timeout"
+
+# Key in g of the surrogate keys of the current response
+SURROGATE_KEYS = "_asm_surrogate_keys"
+
+# Prefix of the cache keys holding the time a surrogate key was purged
+PURGE_KEY_PREFIX = "asm/purge/"
+
+# Prefix of the @cache entries, so they are not mixed with the values
+# saved under the same keys by flask_caching `cached`
+CACHE_ENTRY_PREFIX = "asm/cache/v1/"
+
+# Timeout of the purge marks when a @cache entry doesn't expire
+PURGE_MAX_TIMEOUT = 30 * 86400
+
+# (timeout, stale_while_revalidate) of the @cache decorators, for the
+# timeout of the purge marks. They are the same in all the processes
+_cache_lifetimes = set()
+
+# Cache-Control directives accepted by @cache_control
+CACHE_CONTROL_DIRECTIVES = ("public", "private", "no_cache", "no_store",
+                            "no_transform", "must_revalidate", "proxy_revalidate",
+                            "immutable", "max_age", "s_maxage",
+                            "stale_while_revalidate", "stale_if_error")
+
+@app_context
+def _init_json_backend(app):
+    utils.set_json_backend(app.config.get("JSON_BACKEND", "stdlib"))
+
+
 @app_context
 def _init_caching(app):
     utils.flatten_config_property("CACHE", app.config)
     caching.init_app(app)
 
-cache = caching.cached
+
+def cache(timeout=None,
+          key_prefix="view/%s",
+          unless=None,
+          forced_update=None,
+          response_filter=None,
+          query_string=False,
+          hash_method=hashlib.md5,
+          cache_none=False,
+          make_cache_key=None,
+          source_check=None,
+          *,
+          vary_by=None,
+          stale_while_revalidate=0,
+          lock_timeout=30):
+    """
+    Decorator to cache the view response.
+    It takes the arguments of flask_caching `Cache.cached`, in the same order
+    :param timeout: int - seconds the entry is fresh. None uses CACHE_DEFAULT_TIMEOUT
+    :param key_prefix: str - '%s' is replaced by the request path. Or a callable
+        returning the key
+    :param unless: callable - when it returns True, the cache is bypassed.
+        It receives (f, *args, **kwargs) if it takes arguments
+    :param forced_update: callable - when it returns True, the view is called and cached again.
+        It receives the view arguments if it takes arguments
+    :param response_filter: callable - receives the value, when it returns False it's not cached
+    :param query_string: bool - to vary by the whole query string
+    :param hash_method: the hash function of the varying part of the key
+    :param cache_none: bool - to cache None values
+    :param make_cache_key: callable - receives the view arguments, returns the cache key
+    :param source_check: bool - to vary by the source of the view, so a change of
+        the code invalidates the entries. None uses CACHE_SOURCE_CHECK
+    :param vary_by: list - rules to vary the cache key by
+    :param stale_while_revalidate: int - seconds an expired entry is served while refreshed
+    :param lock_timeout: int - seconds a recompute can hold the lock
+    :return:
+
+    As flask_caching, the view is called when the cache backend fails, and the
+    decorated view has `uncached`, the view, and `cache_timeout`
+    """
+    def can_cache(value):
+        if value is None and not cache_none:
+            return False
+        return not response_filter or response_filter(value)
+
+    def decorator(f):
+        if inspect.isclass(f):
+            apply_function_to_members(f, decorator)
+            return f
+
+        source = []
+        _cache_lifetimes.add((timeout, stale_while_revalidate))
+
+        @functools.wraps(f)
+        def decorated_view(*args, **kwargs):
+            if callable(unless) and _call_predicate(unless, (f,) + args, kwargs) is True:
+                return f(*args, **kwargs)
+            if make_cache_key:
+                key = make_cache_key(*args, **kwargs)
+            else:
+                key = _make_cache_key(key_prefix, vary_by, query_string, hash_method)
+            key = CACHE_ENTRY_PREFIX + key
+            _source_check = current_app.config.get("CACHE_SOURCE_CHECK", False) \
+                if source_check is None else source_check
+            if _source_check:
+                if not source:
+                    source.append(_get_source_hash(f, hash_method))
+                key += "#" + source[0]
+            call = functools.partial(f, *args, **kwargs)
+            _timeout = decorated_view.cache_timeout
+            if _timeout is None:
+                _timeout = current_app.config.get("CACHE_DEFAULT_TIMEOUT", 300)
+            setattr(g, RESPONSE_CACHE_TIMEOUT,
+                    _timeout + stale_while_revalidate if _timeout else 0)
+            if callable(forced_update) and _call_predicate(forced_update, args, kwargs) is True:
+                return _cache_store(key, call, _timeout, stale_while_revalidate, can_cache,
+                                    g.get(SURROGATE_KEYS))
+            return _cached_call(key, call, _timeout, stale_while_revalidate, lock_timeout,
+                                can_cache)
+
+        decorated_view.uncached = f
+        decorated_view.cache_timeout = timeout
+        return decorated_view
+    return decorator
+
+
+def _call_predicate(fn, args, kwargs):
+    """
+    Call the unless/forced_update functions as flask_caching does: with the
+    arguments only if it takes arguments
+    """
+    spec = inspect.getfullargspec(fn)
+    if spec.args or spec.varargs or spec.varkw:
+        return fn(*args, **kwargs)
+    return fn()
+
+
+def _get_source_hash(f, hash_method):
+    try:
+        source = inspect.getsource(f).encode("utf-8")
+    except (OSError, TypeError):
+        source = inspect.unwrap(f).__code__.co_code
+    return hash_method(source).hexdigest()
+
+
+def cache_control(surrogate_keys=None, **directives):
+    """
+    Decorator to set the Cache-Control header of the response, and tag it
+    with surrogate keys. Works on class and methods.
+
+    The surrogate keys are sent in the Surrogate-Key header, for CDNs, and 
+    saved with the @cache and @page_cache entries, to purge them with 
+    `response.purge(*keys)`. A key is a string, formatted with the view 
+    arguments, or a function called with the view arguments returning
+    a string or a list.
+
+    @response.cache_control(public=True, max_age=60, s_maxage=300,
+                            surrogate_keys=["posts", "post-{id}"])
+    @response.cache(60)
+    def post(self, id):
+        ...
+
+    Put it above @cache, so it's also set when the response comes from the cache.
+    The headers are only set on 2xx and 304 responses, not to cache the errors.
+
+    :param surrogate_keys: list, or a str for one key
+    :param directives: the Cache-Control directives, ie: public=True, max_age=60.
+        True adds the directive, an int its value, False and None skip it
+    :return:
+    """
+    for name in directives:
+        if name not in CACHE_CONTROL_DIRECTIVES:
+            raise TypeError("Invalid Cache-Control directive '%s'" % name)
+    value = ", ".join(name.replace("_", "-") if v is True
+                      else "%s=%s" % (name.replace("_", "-"), int(v))
+                      for name, v in directives.items()
+                      if v is not None and v is not False)
+
+    def decorator(f):
+        if inspect.isclass(f):
+            apply_function_to_members(f, decorator)
+            return f
+
+        @functools.wraps(f)
+        def decorated_view(*args, **kwargs):
+            keys = _get_surrogate_keys(surrogate_keys, args, kwargs)
+            if keys:
+                g.setdefault(SURROGATE_KEYS, set()).update(keys)
+
+            def set_headers(response):
+                if not (200 <= response.status_code < 300 or response.status_code == 304):
+                    return response
+                if value:
+                    response.headers["Cache-Control"] = value
+                if keys:
+                    response.headers["Surrogate-Key"] = " ".join(sorted(g.get(SURROGATE_KEYS, keys)))
+                return response
+
+            after_this_request(set_headers)
+            return f(*args, **kwargs)
+        return decorated_view
+    return decorator
+
+
+def _get_surrogate_keys(surrogate_keys, args, kwargs):
+    if isinstance(surrogate_keys, str) or callable(surrogate_keys):
+        surrogate_keys = [surrogate_keys]
+    keys = []
+    for key in surrogate_keys or ():
+        if callable(key):
+            key = key(*args, **kwargs)
+            keys.extend([key] if isinstance(key, str) else key)
+        else:
+            keys.append(key.format(**kwargs))
+    return keys
+
+
+def purge(*keys):
+    """
+    Purge the cached responses tagged with the surrogate keys, in the 
+    @cache entries and the page cache. ie: when a model changes
+
+    response.purge("posts", "post-%s" % post.id)
+
+    The @cache entries are purged in all the processes sharing the cache
+    backend. The page cache is in memory, it's only purged in the current 
+    process, its pages expire with their timeout in the other ones.
+
+    :param keys: the surrogate keys
+    :return:
+    """
+    if not keys:
+        return
+    now = time.time()
+    caching.set_many({PURGE_KEY_PREFIX + k: now for k in keys}, timeout=_get_purge_timeout())
+    if Assembly._page_cache:
+        Assembly._page_cache.purge(keys)
+
+
+def _get_purge_timeout():
+    """
+    The purge marks are kept as long as the longest @cache entry can live.
+    Config CACHE_PURGE_TIMEOUT overrides it
+    """
+    app_config = current_app.config
+    if app_config.get("CACHE_PURGE_TIMEOUT"):
+        return app_config["CACHE_PURGE_TIMEOUT"]
+    default = app_config.get("CACHE_DEFAULT_TIMEOUT", 300)
+    longest = default
+    for timeout, stale_while_revalidate in _cache_lifetimes:
+        timeout = default if timeout is None else timeout
+        longest = max(longest, timeout + stale_while_revalidate if timeout else PURGE_MAX_TIMEOUT)
+    return longest
+
+
+def page_cache(timeout=60):
+    """
+    Decorator to save the whole response in the page cache, when the config
+    PAGE_CACHE_ENABLED is True. Next requests get it before Flask dispatch:
+    no routing, session, CSRF, or view.
+    It's only for pages that are the same for all the anonymous visitors. 
+    Requests with the session cookie are not served from the page cache, 
+    and responses setting cookies are not saved.
+
+    @response.page_cache(10)
+    def index(self):
+        ...
+
+    :param timeout: int - seconds the page is served from the cache
+    :return:
+    """
+    def decorator(f):
+        if inspect.isclass(f):
+            apply_function_to_members(f, decorator)
+            return f
+
+        @functools.wraps(f)
+        def decorated_view(*args, **kwargs):
+            after_this_request(functools.partial(_mark_page_cache, timeout))
+            return f(*args, **kwargs)
+        return decorated_view
+    return decorator
+
+
+def _mark_page_cache(timeout, response):
+    if request.environ.get(__ASM_PAGE_CACHE_ENVIRON__) and not response.is_streamed:
+        response.headers[__ASM_PAGE_CACHE_HEADER__] = str(int(timeout))
+    return response
+
+
+def _get_vary_value(rule):
+    if callable(rule):
+        return rule()
+    kind, _, name = rule.partition(":")
+    if kind == "args":
+        return request.args.getlist(name)
+    elif kind == "header":
+        return request.headers.get(name)
+    elif kind == "cookie":
+        return request.cookies.get(name)
+    elif kind == "user":
+        if not hasattr(current_app, "login_manager"):
+            return None
+        return current_user.get_id() if current_user.is_authenticated else None
+    raise ValueError("Invalid cache vary_by rule '%s'" % rule)
+
+
+def _make_cache_key(key_prefix, vary_by=None, query_string=False, hash_method=hashlib.md5):
+    if callable(key_prefix):
+        key = key_prefix()
+    else:
+        key = key_prefix % request.path if "%s" in key_prefix else key_prefix
+    vary = []
+    if query_string:
+        vary.append(sorted(request.args.items(multi=True)))
+    if vary_by:
+        vary.extend(_get_vary_value(rule) for rule in vary_by)
+    if vary:
+        key += "?" + hash_method(repr(vary).encode("utf-8")).hexdigest()
+    return key
+
+
+def _cache_backend_error():
+    """
+    Log the error of the cache backend, the view is called instead.
+    In debug, it's raised
+    """
+    if current_app.debug:
+        raise
+    logging.exception("Exception possibly due to cache backend.")
+
+
+def _cache_lock(key, lock_timeout):
+    """
+    Acquire the lock of a key. The backend `add` only sets a missing key.
+    When the backend fails, the lock is acquired
+    """
+    try:
+        return caching.add("lock/" + key, 1, timeout=lock_timeout)
+    except Exception:
+        _cache_backend_error()
+        return True
+
+
+def _cache_unlock(key):
+    try:
+        caching.delete("lock/" + key)
+    except Exception:
+        _cache_backend_error()
+
+
+def _get_cache_entry(key):
+    """
+    Return the entry of a key, None if it's missing, purged, or not an
+    entry of @cache
+    """
+    entry = caching.get(key)
+    if not (isinstance(entry, tuple) and len(entry) == 4) or _is_purged(entry):
+        return None
+    return entry
+
+
+def _cache_store(key, call, timeout, stale_while_revalidate, can_cache=None, keys=None):
+    """
+    Call the view and save the value, with the surrogate keys of the response.
+    The entry is (value, fresh_until, started, surrogate_keys)
+    :param can_cache: callable - receives the value, when it returns False it's not saved
+    :param keys: the surrogate keys of the request. In a background refresh,
+        g is not the one of the request, they must be passed
+    """
+    started = time.time()
+    value = call()
+    if isinstance(value, BaseResponse) and (value.is_streamed or value.direct_passthrough):
+        return value
+    if can_cache and not can_cache(value):
+        return value
+    if timeout:
+        fresh_until = time.time() + timeout
+        timeout += stale_while_revalidate
+    else:
+        fresh_until = float("inf")
+    keys = tuple(set(keys or ()) | set(g.get(SURROGATE_KEYS, ())))
+    try:
+        caching.set(key, (value, fresh_until, started, keys), timeout=timeout)
+    except Exception:
+        _cache_backend_error()
+    return value
+
+
+def _cache_refresh(key, call, timeout, stale_while_revalidate, can_cache=None, keys=None):
+    try:
+        _cache_store(key, call, timeout, stale_while_revalidate, can_cache, keys)
+    finally:
+        _cache_unlock(key)
+
+
+def _is_purged(entry):
+    """
+    An entry is purged if one of its surrogate keys was purged after the
+    view was called
+    """
+    started, keys = entry[2], entry[3]
+    if not keys:
+        return False
+    purged = caching.get_many(*[PURGE_KEY_PREFIX + k for k in keys])
+    return any(t is not None and t >= started for t in purged)
+
+
+def _cached_call(key, call, timeout, stale_while_revalidate, lock_timeout, can_cache=None):
+    """
+    Return the cached value of a key, or compute it with `call`.
+    A stale entry is returned and refreshed in the background.
+    On a miss, only the request holding the lock computes, the others wait
+    for the value
+    """
+    try:
+        entry = _get_cache_entry(key)
+    except Exception:
+        _cache_backend_error()
+        return call()
+    if entry is not None:
+        value, fresh_until = entry[:2]
+        if time.time() >= fresh_until and _cache_lock(key, lock_timeout):
+            refresh = copy_current_request_context(_cache_refresh)
+            threading.Thread(target=refresh,
+                             args=(key, call, timeout, stale_while_revalidate, can_cache,
+                                   g.get(SURROGATE_KEYS)),
+                             daemon=True).start()
+        return value
+
+    locked = _cache_lock(key, lock_timeout)
+    if not locked:
+        deadline = time.time() + lock_timeout
+        while time.time() < deadline:
+            time.sleep(0.05)
+            try:
+                entry = _get_cache_entry(key)
+                if entry is not None:
+                    return entry[0]
+                # released without a value, ie: the view failed
+                if caching.get("lock/" + key) is None:
+                    break
+            except Exception:
+                _cache_backend_error()
+                break
+    try:
+        return _cache_store(key, call, timeout, stale_while_revalidate, can_cache)
+    finally:
+        if locked:
+            _cache_unlock(key)
 
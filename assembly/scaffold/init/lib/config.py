@@ -67,6 +67,19 @@ class BaseConfig(object):
     # To remove whitespace off the HTML result
     COMPRESS_HTML = False
 
+    # To also collapse the whitespace of the dynamic output, when the response is sent
+    COMPRESS_HTML_OUTPUT = False
+
+    # To send the stylesheets and scripts of the {% renderblock %} as preload Link headers
+    PRELOAD_LINK_HEADERS = False
+
+    # Number of converted markdown texts to keep in memory. 0 to disable
+    MARKDOWN_CACHE_SIZE = 256
+
+    # JSON backend for the json responses and utils.to_json: stdlib, orjson, auto
+    # orjson must be installed. 'auto' uses orjson if it's installed
+    JSON_BACKEND = "stdlib"
+
     # Data directory
     DATA_DIR = DATA_DIR
 
@@ -296,6 +309,107 @@ class BaseConfig(object):
         "DIR": ""
     }
 
+    #--------- TEMPLATES CACHE ----------
+    #: Compiled templates are saved in a bytecode cache, so workers don't
+    #: compile them again. Run `asm gen:compile-templates` on deploy to
+    #: compile them ahead
+    TEMPLATES_CACHE = {
+        #: TEMPLATES_CACHE_TYPE
+        #: None: no cache
+        #: filesystem: save in TEMPLATES_CACHE_DIR
+        #: cache: save in the CACHE backend
+        "TYPE": None,
+
+        #: TEMPLATES_CACHE_DIR
+        #: Directory to save compiled templates when TYPE is filesystem
+        "DIR": os.path.join(DATA_DIR, "templates-cache"),
+
+        #: TEMPLATES_CACHE_TIMEOUT
+        #: Timeout in seconds when TYPE is cache. None doesn't expire
+        "TIMEOUT": None
+    }
+
+    #--------- CORS ----------
+    # Config of the @request.cors views, used by flask_cors.
+    # The preflight requests of these views are answered before Flask dispatch
+    CORS = {
+        #: CORS_ORIGINS
+        #: Origins allowed, a string or a list. Can be regex
+        "ORIGINS": "*",
+
+        #: CORS_SUPPORTS_CREDENTIALS
+        #: To allow cookies and the Authorization header
+        "SUPPORTS_CREDENTIALS": False,
+
+        #: CORS_MAX_AGE
+        #: Seconds the browser can keep a preflight response. None to not send it
+        "MAX_AGE": 600,
+
+        #: CORS_PREFLIGHT
+        #: To answer the preflight requests before Flask dispatch
+        "PREFLIGHT": True
+    }
+
+    #--------- RATE_LIMIT ----------
+    # Counters of the @request.rate_limit views
+    RATE_LIMIT = {
+        #: RATE_LIMIT_ENABLED
+        "ENABLED": True,
+
+        #: RATE_LIMIT_STORAGE
+        #: memory: a token bucket per client, in each process
+        #: cache: counters in the CACHE backend, shared by all the processes. ie: redis
+        "STORAGE": "memory",
+
+        #: RATE_LIMIT_HEADERS
+        #: To send the X-RateLimit-Limit and X-RateLimit-Remaining headers
+        "HEADERS": True,
+
+        #: RATE_LIMIT_MAX_CLIENTS
+        #: Number of clients kept in memory, per process
+        "MAX_CLIENTS": 10000
+    }
+
+    #--------- PAGE_CACHE ----------
+    # Serve the pages marked with @response.page_cache from memory, before
+    # Flask dispatch. For pages that are the same for all anonymous visitors
+    PAGE_CACHE = {
+        #: PAGE_CACHE_ENABLED
+        "ENABLED": False,
+
+        #: PAGE_CACHE_MAX_SIZE
+        #: Number of pages to keep in memory, per process
+        "MAX_SIZE": 1000,
+
+        #: PAGE_CACHE_SKIP_COOKIES
+        #: Requests with these cookies always go to the app. The session
+        #: and remember cookies are already included
+        "SKIP_COOKIES": []
+    }
+
+    #--------- COMPRESS_RESPONSE ----------
+    # Compress the responses with gzip, deflate or br (if brotli is installed)
+    # when no proxy in front of the app does it
+    COMPRESS_RESPONSE = {
+        #: COMPRESS_RESPONSE_ENABLED
+        "ENABLED": False,
+
+        #: COMPRESS_RESPONSE_MIN_SIZE
+        #: Responses smaller than this size, in bytes, are sent as is
+        "MIN_SIZE": 500,
+
+        #: COMPRESS_RESPONSE_LEVEL
+        #: Compression level, 1-9
+        "LEVEL": 6,
+
+        #: COMPRESS_RESPONSE_MIMETYPES
+        #: Content types to compress
+        "MIMETYPES": ["text/html", "text/css", "text/xml", "text/plain",
+                      "text/javascript", "application/json",
+                      "application/javascript", "application/xml",
+                      "image/svg+xml"]
+    }
+
     #--------- LOGIN_MANAGER ----------
     # Flask-Login login_manager configuration
     LOGIN_MANAGER = {
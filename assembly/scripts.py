@@ -226,6 +226,32 @@ def assets2s3():
     print("")
 
 
+@cli.command("gen:compile-templates")
+@catch_exception
+def compile_templates():
+    """ Compile templates into the templates cache """
+    header("Compile Templates")
+    jinja_env = asm_app.jinja_env
+    if not jinja_env.bytecode_cache:
+        print("Templates cache is not set. Set config TEMPLATES_CACHE_TYPE")
+        print("")
+        return
+
+    compiled, errors = 0, 0
+    with asm_app.app_context():
+        for name in jinja_env.list_templates():
+            try:
+                jinja_env.get_template(name)
+                compiled += 1
+            except Exception as ex:
+                errors += 1
+                print("- ERROR %s: %s" % (name, ex))
+    print("Templates compiled: %s" % compiled)
+    if errors:
+        print("Templates with errors: %s" % errors)
+    print("")
+
+
 @cli.command("gen:version")
 def version():
     """Get the version"""
@@ -24,8 +24,13 @@ import arrow
 import string
 import random
 import hashlib
+import numbers
 import datetime
+import threading
+import collections
+import collections.abc
 from slugify import slugify
+from dicttoxml import make_valid_xml_name
 from distutils.file_util import copy_file, move_file
 from distutils.dir_util import copy_tree, remove_tree, mkpath
 from inflection import (dasherize,
@@ -43,11 +48,16 @@ gen_md5
 gen_uuid
 gen_uuid_hex
 to_json
+json_dumps
+set_json_backend
+to_xml
+iter_xml
 chunk_list
 in_any_list
 dict_replace
 list_replace
 DotDict
+LRUCache
 is_valid_email
 is_valid_password
 is_valid_username
@@ -219,19 +229,246 @@ def to_json(d):
     :param d: dict or list
     :return: json data
     """
-    return json.dumps(d, cls=_JSONEncoder)
+    return json_dumps(d)
 
 
-class _JSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, arrow.Arrow):
-            return obj.for_json()
-        elif isinstance(obj, datetime.datetime):
-            return obj.strftime('%Y-%m-%dT%H:%M:%SZ')
-        elif isinstance(obj, datetime.date):
-            return obj.strftime('%Y-%m-%d')
-        # Let the base class default method raise the TypeError
-        return json.JSONEncoder.default(self, obj)
+"""
+JSON backend
+
+All the JSON output goes through `json_dumps`, with the stdlib json or 
+orjson when it is installed. Set it with `set_json_backend`
+    - stdlib: python json
+    - orjson: https://github.com/ijl/orjson
+    - auto: orjson if it's installed, otherwise stdlib
+
+Arrow, datetime and date are formatted the same way with both:
+    arrow.Arrow: isoformat, ie: 2020-01-01T00:00:00+00:00
+    datetime: 2020-01-01T00:00:00Z
+    date: 2020-01-01
+orjson formats datetime and date natively. The only difference is for
+timezone aware datetimes not in UTC, orjson keeps their offset 
+ie: 2020-01-01T00:00:00+05:00
+With a `default` function, datetime, date and dataclasses are converted
+by it instead, ie: jsonify keeps Flask's formats with both backends
+"""
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKENDS = ("stdlib", "orjson", "auto")
+_json_backend = "stdlib"
+
+
+
+def _json_datetime(o):
+    if o.tzinfo is None:
+        return o.isoformat(timespec="seconds") + "Z"
+    return o.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+# Encoders by type, looked up before the isinstance checks for subclasses
+_json_types = collections.OrderedDict([
+    (arrow.Arrow, arrow.Arrow.isoformat),
+    (datetime.datetime, _json_datetime),
+    (datetime.date, datetime.date.isoformat),
+    (uuid.UUID, str),
+])
+
+
+def _json_default(obj):
+    encoder = _json_types.get(type(obj))
+    if encoder:
+        return encoder(obj)
+    for t, encoder in _json_types.items():
+        if isinstance(obj, t):
+            return encoder(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError("Object of type '%s' is not JSON serializable" % type(obj).__name__)
+
+
+def set_json_backend(name):
+    """
+    Set the backend used by json_dumps
+    :param name: stdlib, orjson or auto
+    :return: str - the backend name in use
+    """
+    global _json_backend
+    if name not in JSON_BACKENDS:
+        raise ValueError("Invalid JSON backend '%s'. Must be one of: %s" 
+                         % (name, ", ".join(JSON_BACKENDS)))
+    if name == "auto":
+        name = "orjson" if orjson else "stdlib"
+    if name == "orjson" and not orjson:
+        raise ImportError("JSON backend 'orjson' requires the package 'orjson'")
+    _json_backend = name
+    return name
+
+
+def get_json_backend():
+    return _json_backend
+
+
+def json_dumps(obj, default=None, **kwargs):
+    """
+    Serialize to a json string with the current backend.
+    With orjson, only sort_keys and indent are used, the output is compact
+    and not ascii escaped. A custom encoder `cls` always uses the stdlib
+    :param obj: the data
+    :param default: function converting the types json can't serialize.
+        It gets all the datetime, date and dataclasses with both backends.
+        By default arrow, datetime and date are converted to ISO strings
+    :param kwargs: the stdlib json.dumps arguments
+    :return: str
+    """
+    if "cls" in kwargs:
+        return json.dumps(obj, **kwargs)
+    if _json_backend == "orjson":
+        option = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z \
+            | orjson.OPT_OMIT_MICROSECONDS | orjson.OPT_NON_STR_KEYS
+        if default:
+            option |= orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if kwargs.get("sort_keys"):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default or _json_default, option=option).decode("utf-8")
+    kwargs["default"] = default or _json_default
+    return json.dumps(obj, **kwargs)
+
+
+"""
+XML
+
+`iter_xml` writes the XML incrementally, with the same output as 
+dicttoxml(obj) with its default arguments. Chunks are yielded as the data
+is walked, so generators are never loaded in memory
+"""
+
+# Size of the chunks yielded by iter_xml
+XML_CHUNK_SIZE = 8192
+
+_xml_names = {}
+_xml_number_types = {int: "int", float: "float", bool: "bool"}
+_xml_escape_table = str.maketrans({"&": "&amp;", '"': "&quot;", "'": "&apos;",
+                                   "<": "&lt;", ">": "&gt;"})
+
+
+def _xml_name(key):
+    """
+    Return the element name and its attributes string for a dict key.
+    dicttoxml validates each key with a xml parser, the result is kept by key
+    """
+    k = (type(key), key)
+    name = _xml_names.get(k)
+    if name is None:
+        tag, attr = make_valid_xml_name(key, {})
+        attrs = ' name="%s"' % attr["name"] if "name" in attr else ""
+        if len(_xml_names) > 10000:
+            _xml_names.clear()
+        name = _xml_names[k] = (tag, attrs)
+    return name
+
+
+def _xml_value(key, attrs, val):
+    """
+    Return the element of a scalar value, or None if it's not a scalar
+    """
+    if type(val) is str:
+        return '<%s%s type="str">%s</%s>' % (key, attrs, val.translate(_xml_escape_table), key)
+    if isinstance(val, numbers.Number):
+        t = _xml_number_types.get(type(val), "number")
+        return '<%s%s type="%s">%s</%s>' % (key, attrs, t, val, key)
+    if hasattr(val, "isoformat"):
+        return '<%s%s type="str">%s</%s>' % (key, attrs, val.isoformat().translate(_xml_escape_table), key)
+    if val is None:
+        return '<%s%s type="null"></%s>' % (key, attrs, key)
+    return None
+
+
+def _iter_xml_dict(obj, buf):
+    for key, val in obj.items():
+        key, attrs = _xml_name(key)
+        if type(val) is bool:
+            buf.append('<%s%s type="bool">%s</%s>' % (key, attrs, str(val).lower(), key))
+            continue
+        el = _xml_value(key, attrs, val)
+        if el is not None:
+            buf.append(el)
+        elif isinstance(val, dict):
+            buf.append('<%s%s type="dict">' % (key, attrs))
+            yield from _iter_xml_dict(val, buf)
+            buf.append('</%s>' % key)
+        elif isinstance(val, collections.abc.Iterable):
+            buf.append('<%s%s type="list">' % (key, attrs))
+            yield from _iter_xml_list(val, buf)
+            buf.append('</%s>' % key)
+        else:
+            raise TypeError('Unsupported data type: %s (%s)' % (val, type(val).__name__))
+        if len(buf) > 256:
+            yield
+
+
+def _iter_xml_list(items, buf):
+    for item in items:
+        el = _xml_value("item", "", item)
+        if el is not None:
+            buf.append(el)
+        elif isinstance(item, dict):
+            buf.append('<item type="dict">')
+            yield from _iter_xml_dict(item, buf)
+            buf.append('</item>')
+        elif isinstance(item, collections.abc.Iterable):
+            buf.append('<item type="list">')
+            yield from _iter_xml_list(item, buf)
+            buf.append('</item>')
+        else:
+            raise TypeError('Unsupported data type: %s (%s)' % (item, type(item).__name__))
+        if len(buf) > 256:
+            yield
+
+
+def iter_xml(obj, chunk_size=XML_CHUNK_SIZE):
+    """
+    Convert data to XML by chunks
+    :param obj: dict, list, generator or scalar
+    :param chunk_size: int - the minimum size of the chunks
+    :return: generator of str
+    """
+    buf = ['<?xml version="1.0" encoding="UTF-8" ?><root>']
+    if type(obj) is bool:
+        buf.append('<item type="bool">%s</item>' % str(obj).lower())
+        walker = ()
+    elif _xml_value("item", "", obj) is not None:
+        buf.append(_xml_value("item", "", obj))
+        walker = ()
+    elif isinstance(obj, dict):
+        walker = _iter_xml_dict(obj, buf)
+    elif isinstance(obj, collections.abc.Iterable):
+        walker = _iter_xml_list(obj, buf)
+    else:
+        raise TypeError('Unsupported data type: %s (%s)' % (obj, type(obj).__name__))
+    # the walker signals every few hundred elements
+    for _ in walker:
+        chunk = "".join(buf)
+        del buf[:]
+        if len(chunk) >= chunk_size:
+            yield chunk
+        else:
+            buf.append(chunk)
+    buf.append("</root>")
+    yield "".join(buf)
+
+
+def to_xml(obj):
+    """
+    Convert data to XML, the same as dicttoxml
+    :param obj: dict or list
+    :return: str
+    """
+    return "".join(iter_xml(obj))
+
 
 class DotDict(dict):
     """
@@ -266,6 +503,83 @@ class DotDict(dict):
             return default
 
 
+class LRUCache(object):
+    """
+    A thread-safe Least Recently Used cache, with hits/misses stats.
+    When it's full, the least recently used entry is discarded.
+    maxsize=0 disables the cache.
+
+    cache = LRUCache(maxsize=128)
+    cache.set("key", "value")
+    cache.get("key")
+    cache.stats()
+    """
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def items(self):
+        """ A copy of the (key, value) entries, from the least recently used """
+        with self._lock:
+            return list(self._data.items())
+
+    def resize(self, maxsize):
+        """ Change the max size, discarding the least recently used entries """
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > max(maxsize, 0):
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        :return: dict - hits, misses, hit_rate, size, maxsize
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize
+        }
+
+    def __len__(self):
+        return len(self._data)
+
+
 def flatten_config_property(key, config):
     """
     To flatten a config property
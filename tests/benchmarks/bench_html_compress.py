@@ -0,0 +1,88 @@
+"""
+Benchmark: HTMLCompress compile time, and bytes saved at compile time and
+with the output minifier on a large template
+
+Run: python -m tests.benchmarks.bench_html_compress
+"""
+
+import time
+import jinja2
+from assembly import _extensions
+
+ROW = """
+        <tr class="row">
+            <td>
+                {{ item.name }}
+            </td>
+            <td>{{ item.description }}</td>
+            <td>
+                <a href="/items/{{ item.id }}">
+                    view
+                </a>
+            </td>
+        </tr>
+"""
+
+TEMPLATE = """
+<html>
+    <head>
+        <style>
+            body { margin: 0; }
+        </style>
+    </head>
+    <body>
+        <div class="content">
+            %s
+            <table>
+                {%% for item in items %%}
+                    {%% include "row.html" %%}
+                {%% endfor %%}
+            </table>
+            <pre>
+    keep   this
+            </pre>
+        </div>
+    </body>
+</html>
+""" % ("<p>\n    Some   static   text\n</p>\n" * 200)
+
+
+def make_env(compress):
+    extensions = [_extensions.HTMLCompress] if compress else []
+    loader = jinja2.DictLoader({"page.html": TEMPLATE, "row.html": ROW})
+    return jinja2.Environment(loader=loader, extensions=extensions)
+
+
+def compile_time(env, n=20):
+    best = None
+    for _ in range(n):
+        start = time.perf_counter()
+        env.compile(TEMPLATE, "page.html")
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    items = [{"id": i,
+              "name": "Item %d" % i,
+              "description": "\n    Some   text\n    from   the   db\n"}
+             for i in range(500)]
+    plain = make_env(False)
+    compress = make_env(True)
+    print("compile: plain %.2f ms, HTMLCompress %.2f ms"
+          % (compile_time(plain), compile_time(compress)))
+
+    html = plain.get_template("page.html").render(items=items)
+    compressed = compress.get_template("page.html").render(items=items)
+    print("bytes: plain %d, HTMLCompress %d" % (len(html), len(compressed)))
+    minify = getattr(_extensions, "minify_html", None)
+    if minify:
+        start = time.perf_counter()
+        minified = minify(compressed)
+        elapsed = (time.perf_counter() - start) * 1000
+        print("bytes: HTMLCompress + minify_html %d (%.2f ms)" % (len(minified), elapsed))
+
+
+if __name__ == "__main__":
+    main()
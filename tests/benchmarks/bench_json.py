@@ -0,0 +1,56 @@
+"""
+Benchmark: JSON serialization of 10k rows with arrow, datetime and date
+values, with utils.to_json and the response jsonify, for each JSON backend
+
+Run: python -m tests.benchmarks.bench_json
+"""
+
+import time
+import arrow
+import datetime
+from flask import Flask, jsonify
+from assembly import utils
+import assembly.response
+
+ROWS = 10000
+LOOPS = 10
+
+
+def make_rows():
+    now = arrow.utcnow()
+    return [{
+        "id": i,
+        "name": "Item %s" % i,
+        "price": i * 1.5,
+        "active": bool(i % 2),
+        "tags": ["a", "b", "c"],
+        "created_at": now,
+        "updated_at": datetime.datetime(2020, 1, 1, 12, 30, i % 60),
+        "published_on": datetime.date(2020, 1, 1 + i % 28),
+    } for i in range(ROWS)]
+
+
+def bench(name, fn, data):
+    fn(data)
+    start = time.time()
+    for _ in range(LOOPS):
+        fn(data)
+    ms = (time.time() - start) * 1000.0 / LOOPS
+    print("  %-10s %8.2f ms / %s rows" % (name, ms, ROWS))
+
+
+def run():
+    data = {"rows": make_rows()}
+    app = Flask(__name__)
+    backends = ["stdlib"] + (["orjson"] if utils.orjson else [])
+    with app.app_context():
+        for backend in backends:
+            utils.set_json_backend(backend)
+            print("backend: %s" % backend)
+            bench("to_json", utils.to_json, data)
+            bench("jsonify", jsonify, data)
+    utils.set_json_backend("stdlib")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,82 @@
+"""
+Benchmark: requests/sec of a cached page through the whole WSGI stack,
+with @response.cache only and with the PageCache middleware, which
+answers before Flask dispatch. Prints the page cache hit ratio and the
+latency it saved.
+
+Run: python -m tests.benchmarks.bench_page_cache
+"""
+
+import time
+import jinja2
+from flask import Flask
+from werkzeug.test import EnvironBuilder
+from assembly import Assembly, response
+from assembly.assembly import PageCache, _make_template_path
+
+N = 5000
+
+
+class BenchPageCache(Assembly):
+
+    @response.cache(60)
+    def index(self):
+        return {"items": list(range(50))}
+
+    @response.page_cache(60)
+    @response.cache(60)
+    def page(self):
+        return {"items": list(range(50))}
+
+
+def make_app():
+    app = Flask(__name__)
+    app.secret_key = "secret"
+    app.config["CACHE_TYPE"] = "simple"
+    app.jinja_loader = jinja2.DictLoader({
+        _make_template_path(BenchPageCache, name):
+            "<ul>{% for i in items %}<li>{{ i }}</li>{% endfor %}</ul>"
+        for name in ("index", "page")
+    })
+    response.caching.init_app(app)
+    Assembly._app = app
+    BenchPageCache._register__(app, base_route="/")
+    app.wsgi_app = PageCache(app.wsgi_app)
+    return app
+
+
+def bench(app, path, headers=None):
+    environ = EnvironBuilder(path=path, headers=headers).get_environ()
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    def call():
+        it = app(dict(environ), start_response)
+        for _ in it:
+            pass
+        if hasattr(it, "close"):
+            it.close()
+
+    call()
+    start = time.perf_counter()
+    for _ in range(N):
+        call()
+    return N / (time.perf_counter() - start)
+
+
+def run():
+    app = make_app()
+    print("@response.cache only      %8.0f req/s" % bench(app, "/"))
+    # warm up the page, the session cookie bypasses the page cache
+    bench(app, "/page/", headers={"Cookie": "session=1"})
+    app.wsgi_app.clear()
+    print("@response.page_cache      %8.0f req/s" % bench(app, "/page/"))
+    stats = app.wsgi_app.stats()
+    print("page cache: hit ratio %.3f, saved %.1f ms in total, %.3f ms per hit"
+          % (stats["hit_rate"], stats["saved_seconds"] * 1000,
+             stats["saved_seconds"] * 1000 / max(stats["hits"], 1)))
+
+
+if __name__ == "__main__":
+    run()
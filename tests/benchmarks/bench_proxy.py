@@ -0,0 +1,62 @@
+"""
+Benchmark: requests/sec through the Assembly view proxy
+
+Calls the registered proxy directly inside a request context, so the numbers
+reflect the dispatch overhead of Assembly, not the Flask/Werkzeug routing.
+
+Run: python -m tests.benchmarks.bench_proxy
+"""
+
+import time
+from flask import Flask
+from assembly import Assembly
+
+
+class BenchProxy(Assembly):
+
+    def _before_request(self, name, **kw):
+        pass
+
+    def _before_index(self, **kw):
+        pass
+
+    def index(self):
+        return "ok"
+
+    def page(self):
+        return {}
+
+    def _renderer(self, data):
+        return "rendered"
+
+    def _after_index(self, response):
+        return response
+
+    def _after_request(self, name, response):
+        return response
+
+
+def bench(app, endpoint, n, repeat=5):
+    """ Best of `repeat` runs of `n` calls """
+    proxy = app.view_functions[endpoint]
+    best = None
+    with app.test_request_context("/"):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(n):
+                proxy()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return n / best
+
+
+def main(n=20000):
+    app = Flask(__name__)
+    BenchProxy._register__(app, base_route="/")
+    for action in ["index", "page"]:
+        endpoint = "%s.BenchProxy.%s" % (__name__, action)
+        print("%-10s %10.0f req/s" % (action, bench(app, endpoint, n)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark: cost of a @request.rate_limit check, in the token bucket alone
+and inside a request, against the same view without the decorator
+
+Run: python -m tests.benchmarks.bench_rate_limit
+"""
+
+import time
+from flask import Flask
+from werkzeug.test import EnvironBuilder
+from assembly import request
+from assembly.request import TokenBucket, rate_limiter
+
+N = 20000
+
+
+def bench_bucket():
+    bucket = TokenBucket()
+    keys = ["view:10.0.0.%d" % (i % 250) for i in range(N)]
+    start = time.perf_counter()
+    for key in keys:
+        bucket.hit(key, 1000000, 60)
+    return (time.perf_counter() - start) / N * 1e6
+
+
+def make_app():
+    app = Flask(__name__)
+
+    @app.route("/")
+    def index():
+        return "ok"
+
+    @app.route("/limited")
+    @request.rate_limit("1000000/minute")
+    def limited():
+        return "ok"
+
+    return app
+
+
+def bench_request(app, path):
+    environ = EnvironBuilder(path=path).get_environ()
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    def call():
+        for _ in app(dict(environ), start_response):
+            pass
+
+    call()
+    start = time.perf_counter()
+    for _ in range(N):
+        call()
+    return (time.perf_counter() - start) / N * 1e6
+
+
+def run():
+    print("TokenBucket.hit                 %6.2f us" % bench_bucket())
+    app = make_app()
+    rate_limiter.store = TokenBucket()
+    plain = bench_request(app, "/")
+    limited = bench_request(app, "/limited")
+    print("request without rate_limit      %6.2f us" % plain)
+    print("request with rate_limit         %6.2f us (+%.2f us)" % (limited, limited - plain))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,28 @@
+"""
+Benchmark: template loader lookups/sec with 50 view packages registered
+
+Run: python -m tests.benchmarks.bench_template_loader
+"""
+
+import time
+import jinja2
+from assembly.assembly import _JinjaPrefixLoader
+
+
+def main(packages=50, n=20000, repeat=5):
+    mapping = {"app%d.views" % i: jinja2.DictLoader({}) for i in range(packages)}
+    loader = _JinjaPrefixLoader(mapping)
+    templates = ["app%d/views/Index/index.html" % i for i in range(packages)]
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(n // packages):
+            for t in templates:
+                loader.get_loader(t)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print("%d packages: %10.0f lookups/s" % (packages, n / best))
+
+
+if __name__ == "__main__":
+    main()
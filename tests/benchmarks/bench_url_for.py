@@ -0,0 +1,62 @@
+"""
+Benchmark: rendering a page with 1,000 links built with Assembly `url_for`
+from view method references
+
+Run: python -m tests.benchmarks.bench_url_for
+"""
+
+import time
+import jinja2
+from flask import Flask
+from assembly import Assembly, url_for, request
+
+TEMPLATE = """
+<ul>
+{% for i in range(links) %}
+    <li><a href="{{ url_for(view.item, id=i) }}">{{ i }}</a></li>
+    <li><a href="{{ url_for(view.multi) }}">{{ i }}</a></li>
+{% endfor %}
+</ul>
+"""
+
+
+class BenchUrlFor(Assembly):
+
+    def index(self):
+        return self.render(__template__="page.html",
+                           url_for=url_for,
+                           view=self,
+                           links=500)
+
+    def item(self, id):
+        return {}
+
+    @request.route("/multi/")
+    @request.route("/multi-alias/")
+    def multi(self):
+        return {}
+
+
+def main(n=50, repeat=5, routes=300):
+    app = Flask(__name__)
+    # a deployment has many more routes than this view
+    for i in range(routes):
+        app.add_url_rule("/filler-%d/" % i, "filler.View.action_%d" % i,
+                         lambda: "")
+    app.jinja_loader = jinja2.DictLoader({"page.html": TEMPLATE})
+    Assembly._app = app
+    BenchUrlFor._register__(app, base_route="/")
+    proxy = app.view_functions["%s.BenchUrlFor.index" % __name__]
+    best = None
+    with app.test_request_context("/"):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(n):
+                proxy()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    print("1,000 links: %.2f ms/page" % (best / n * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark: utils.to_xml / iter_xml against dicttoxml on nested payloads
+
+Run: python -m tests.benchmarks.bench_xml
+"""
+
+import time
+import datetime
+import tracemalloc
+from dicttoxml import dicttoxml
+from assembly import utils
+
+LOOPS = 2
+
+
+def make_payload(rows):
+    return {
+        "total": rows,
+        "generated_at": datetime.datetime(2020, 1, 1, 12, 0, 0),
+        "rows": [{
+            "id": i,
+            "name": "Item <%s> & co" % i,
+            "price": i * 1.5,
+            "active": bool(i % 2),
+            "owner": {"id": i % 50, "name": "user %s" % (i % 50), "roles": ["a", "b"]},
+            "tags": ["x", "y", {"nested": [1, 2, None]}],
+        } for i in range(rows)]
+    }
+
+
+def bench(name, fn, data):
+    fn(data)
+    start = time.time()
+    for _ in range(LOOPS):
+        fn(data)
+    return (time.time() - start) * 1000.0 / LOOPS
+
+
+def peak(fn):
+    tracemalloc.start()
+    fn()
+    p = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return p / 1024.0
+
+
+def consume(it):
+    for _ in it:
+        pass
+
+
+def run():
+    for rows in (1000, 10000):
+        data = make_payload(rows)
+        assert utils.to_xml(data) == dicttoxml(data).decode("utf-8")
+        print("%s rows:" % rows)
+        print("  dicttoxml  %8.2f ms" % bench("dicttoxml", dicttoxml, data))
+        print("  to_xml     %8.2f ms" % bench("to_xml", utils.to_xml, data))
+        print("  peak memory: dicttoxml %.0f KB, iter_xml %.0f KB"
+              % (peak(lambda: dicttoxml(data)), peak(lambda: consume(utils.iter_xml(data)))))
+
+
+if __name__ == "__main__":
+    run()
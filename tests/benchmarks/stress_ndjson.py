@@ -0,0 +1,59 @@
+"""
+Stress: peak memory of @response.ndjson and a streamed @response.json
+while sending more and more rows. The peak must stay the same whatever
+the number of rows
+
+Run: python -m tests.benchmarks.stress_ndjson
+"""
+
+import time
+import tracemalloc
+from flask import Flask
+from assembly import response
+
+
+def rows(count):
+    for i in range(count):
+        yield {"id": i, "name": "Item %s" % i, "tags": ["a", "b", "c"]}
+
+
+app = Flask(__name__)
+
+
+@app.route("/ndjson/<int:count>")
+@response.ndjson
+def export_ndjson(count):
+    return rows(count)
+
+
+@app.route("/json/<int:count>")
+@response.json
+def export_json(count):
+    return rows(count)
+
+
+def consume(client, url):
+    resp = client.get(url, buffered=False)
+    size = 0
+    for chunk in resp.response:
+        size += len(chunk)
+    resp.close()
+    return size
+
+
+def run():
+    client = app.test_client()
+    for kind in ("ndjson", "json"):
+        print("%s:" % kind)
+        for count in (10000, 100000, 1000000):
+            tracemalloc.start()
+            start = time.time()
+            size = consume(client, "/%s/%s" % (kind, count))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("  %8d rows  %8.1f MB sent  %6.2fs  peak: %7.1f KB"
+                  % (count, size / 1048576.0, time.time() - start, peak / 1024.0))
+
+
+if __name__ == "__main__":
+    run()
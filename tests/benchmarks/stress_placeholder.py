@@ -0,0 +1,75 @@
+"""
+Stress: placeholder blocks over many concurrent renders, in and out of requests.
+Each render must only get its own blocks, and the memory must stay flat,
+blocks are not kept between renders
+
+Run: python -m tests.benchmarks.stress_placeholder
+"""
+
+import time
+import jinja2
+import tracemalloc
+from flask import Flask, render_template
+from concurrent.futures import ThreadPoolExecutor
+from assembly import _extensions
+
+RENDERS = 100000
+THREADS = 8
+# max growth of the memory between the first tenth of the renders and the end
+MAX_GROWTH = 512 * 1024
+
+app = Flask(__name__)
+_extensions.init_app(app)
+app.jinja_loader = jinja2.DictLoader({
+    "macros.html": '{% macro item(i) %}'
+                   '{% addtoblock "js" %}<script src="/item-{{ i }}.js"></script>{% endaddtoblock %}'
+                   '<li>{{ i }}</li>{% endmacro %}',
+    "page.html": '{% import "macros.html" as m %}'
+                 '<head>{% renderblock "js" %}</head>'
+                 '{% addtoblock "js" %}<script src="/{{ i }}.js"></script>{% endaddtoblock %}'
+                 '<ul>{{ m.item(i) }}</ul>'
+})
+
+
+@app.route("/<int:i>")
+def page(i):
+    return render_template("page.html", i=i)
+
+
+def expected(i):
+    return '<head><script src="/%s.js"></script>\n<script src="/item-%s.js"></script></head>' \
+           '<ul><li>%s</li></ul>' % (i, i, i)
+
+
+def render(i):
+    if i % 2:
+        with app.app_context():
+            html = render_template("page.html", i=i)
+    else:
+        with app.test_client() as client:
+            html = client.get("/%s" % i).get_data(as_text=True)
+    assert html == expected(i), "render %s got the blocks of another one: %s" % (i, html)
+    return i
+
+
+def run():
+    tracemalloc.start()
+    start = time.time()
+    sizes = []
+    step = RENDERS // 10
+    with ThreadPoolExecutor(THREADS) as pool:
+        for n in range(0, RENDERS, step):
+            list(pool.map(render, range(n, n + step)))
+            sizes.append(tracemalloc.get_traced_memory()[0])
+    elapsed = time.time() - start
+    tracemalloc.stop()
+    print("renders: %s in %.2fs, %s threads" % (RENDERS, elapsed, THREADS))
+    for i, size in enumerate(sizes):
+        print("  after %6d renders: %8.1f KB" % ((i + 1) * step, size / 1024.0))
+    growth = sizes[-1] - sizes[0]
+    assert growth < MAX_GROWTH, "memory grew by %.1f KB" % (growth / 1024.0)
+    print("isolation: ok, memory growth: %.1f KB" % (growth / 1024.0))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,62 @@
+"""
+Stress: peak memory of asm.upload_stream on the LOCAL provider while
+uploading larger and larger bodies. The peak must stay the same whatever
+the size of the file
+
+Run: python -m tests.benchmarks.stress_upload_stream
+"""
+
+import os
+import time
+import tempfile
+import tracemalloc
+from flask import Flask
+from werkzeug.test import EnvironBuilder
+from assembly import asm
+
+
+class Body(object):
+    """ A request body of `size` bytes, generated as it's read """
+
+    def __init__(self, size):
+        self.left = size
+
+    def read(self, n=-1):
+        n = self.left if n < 0 else min(n, self.left)
+        self.left -= n
+        return b"x" * n
+
+    readline = read
+
+
+CONTAINER = tempfile.mkdtemp()
+
+app = Flask(__name__)
+app.config.update(STORAGE_PROVIDER="LOCAL",
+                  STORAGE_CONTAINER=CONTAINER,
+                  STORAGE_SERVER=False)
+asm.storage.init_app(app)
+
+
+def upload(size):
+    environ = EnvironBuilder(path="/", method="PUT").get_environ()
+    environ.update({"wsgi.input": Body(size),
+                    "CONTENT_LENGTH": str(size),
+                    "HTTP_X_FILE_NAME": "file.bin"})
+    with app.request_context(environ):
+        obj = asm.upload_stream(extensions=["bin"])
+        os.remove(os.path.join(CONTAINER, obj.name))
+
+
+def run():
+    for mb in (10, 100, 500):
+        tracemalloc.start()
+        start = time.time()
+        upload(mb * 1048576)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("  %4d MB  %6.2fs  peak: %7.1f KB" % (mb, time.time() - start, peak / 1024.0))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,55 @@
+import os
+import hashlib
+import pytest
+import flask_cloudy
+from flask import Flask
+from assembly import asm
+
+
+def test_upload_stream(tmpdir):
+    app = Flask(__name__)
+    app.config.update(STORAGE_PROVIDER="LOCAL",
+                      STORAGE_CONTAINER=str(tmpdir),
+                      STORAGE_SERVER=False,
+                      MAX_CONTENT_LENGTH=1024 * 1024)
+    asm.storage.init_app(app)
+
+    @app.route("/upload", methods=["PUT"])
+    def upload():
+        obj = asm.upload_stream(extensions=["bin"], chunk_size=1000)
+        return {"name": obj.name, "size": obj.size, "checksum": obj.checksum}
+
+    data = os.urandom(10000)
+    c = app.test_client()
+    resp = c.put("/upload", data=data, headers={"X-File-Name": "My File.bin"})
+    assert resp.status_code == 200
+    assert resp.json["name"] == "my-file.bin"
+    assert resp.json["size"] == len(data)
+    assert resp.json["checksum"] == hashlib.sha256(data).hexdigest()
+    assert tmpdir.join("my-file.bin").read_binary() == data
+
+    resp = c.put("/upload", data=data,
+                 headers={"Content-Disposition": 'attachment; filename="other.bin"'})
+    assert resp.json["name"] == "other.bin"
+
+    # too large, no partial file left
+    resp = c.put("/upload", data=os.urandom(1024 * 1024 + 1),
+                 headers={"X-File-Name": "large.bin"})
+    assert resp.status_code == 413
+    assert sorted(os.listdir(str(tmpdir))) == ["my-file.bin", "other.bin"]
+
+    with app.test_request_context("/upload", method="PUT", data=data,
+                                  headers={"X-File-Name": "file.exe"}):
+        with pytest.raises(flask_cloudy.InvalidExtensionError):
+            asm.upload_stream(extensions=["bin"])
+
+
+def test_upload_stream_max_size_while_reading():
+    import io
+    from werkzeug.exceptions import RequestEntityTooLarge
+    checksum = hashlib.sha256()
+    chunks = asm._iter_upload_chunks(io.BytesIO(b"x" * 2500), checksum, 2000, 1000)
+    assert next(chunks) == b"x" * 1000
+    next(chunks)
+    with pytest.raises(RequestEntityTooLarge):
+        next(chunks)
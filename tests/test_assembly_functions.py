@@ -26,3 +26,16 @@ def test__register_view():
     assembly._register_view(Test2)
     assert hasattr(assembly.views.tests.module_test.main, 'Test1')
     assert hasattr(assembly.views.tests.module_test.main2, 'Test2')
+
+
+def test__jinja_prefix_loader():
+    import jinja2
+    import pytest
+    main = jinja2.DictLoader({"Index/index.html": "main"})
+    admin = jinja2.DictLoader({"Index/index.html": "admin"})
+    loader = assembly._JinjaPrefixLoader({"app.main": main, "app.main.admin": admin})
+    env = jinja2.Environment(loader=loader)
+    assert env.get_template("app/main/Index/index.html").render() == "main"
+    assert env.get_template("app/main/admin/Index/index.html").render() == "admin"
+    with pytest.raises(jinja2.exceptions.TemplateNotFound):
+        env.get_template("app/other/Index/index.html")
@@ -0,0 +1,381 @@
+from flask import Flask
+from assembly import Assembly
+
+
+def test_proxy_pipeline_order():
+    calls = []
+
+    class ProxyOrder(Assembly):
+        def _before_request(self, name, **kw):
+            calls.append("before_request:%s" % name)
+
+        def _before_index(self, **kw):
+            calls.append("before_index")
+
+        def index(self):
+            calls.append("index")
+            return "ok"
+
+        def _after_index(self, response):
+            calls.append("after_index")
+            return response
+
+        def _after_request(self, name, response):
+            calls.append("after_request:%s" % name)
+            return response
+
+    app = Flask(__name__)
+    ProxyOrder._register__(app, base_route="/")
+    with app.test_client() as c:
+        assert c.get("/").data == b"ok"
+    assert calls == ["before_request:index", "before_index", "index",
+                     "after_index", "after_request:index"]
+
+
+def test_proxy_before_short_circuit():
+
+    class ProxyShort(Assembly):
+        def _before_index(self, **kw):
+            return "stop"
+
+        def index(self):
+            return "ok"
+
+    app = Flask(__name__)
+    ProxyShort._register__(app, base_route="/")
+    with app.test_client() as c:
+        assert c.get("/").data == b"stop"
+
+
+def test_proxy_renderer():
+
+    class ProxyRenderer(Assembly):
+        def index(self):
+            return {"name": "assembly"}
+
+        def _renderer(self, data):
+            return data["name"]
+
+    app = Flask(__name__)
+    ProxyRenderer._register__(app, base_route="/")
+    with app.test_client() as c:
+        assert c.get("/").data == b"assembly"
+
+
+def test_proxy_render_current_action_template():
+    import jinja2
+
+    class ProxyRenderAction(Assembly):
+        def index(self):
+            return self._render_page()
+
+        def _render_page(self):
+            return self.render(name="assembly")
+
+        def page(self):
+            return {"name": "page"}
+
+    app = Flask(__name__)
+    app.jinja_loader = jinja2.DictLoader({
+        "tests/test_assembly_proxy/ProxyRenderAction/index.html": "index:{{ name }}",
+        "tests/test_assembly_proxy/ProxyRenderAction/page.html": "page:{{ name }}",
+    })
+    ProxyRenderAction._register__(app, base_route="/")
+    with app.test_client() as c:
+        assert c.get("/").data == b"index:assembly"
+        assert c.get("/page/").data == b"page:page"
+
+
+def test_url_for_endpoint_index():
+    from assembly import url_for, request
+
+    class UrlForIndex(Assembly):
+        def index(self):
+            return url_for(self.item, id=1) + "|" + url_for(self.multi)
+
+        def item(self, id):
+            return "item"
+
+        @request.route("/multi/")
+        @request.route("/multi-alias/")
+        def multi(self):
+            return "multi"
+
+    app = Flask(__name__)
+    UrlForIndex._register__(app, base_route="/")
+    with app.test_client() as c:
+        assert c.get("/").data == b"/item/1|/multi-alias/"
+    with app.test_request_context("/"):
+        assert url_for(UrlForIndex.item, id=2) == "/item/2"
+
+
+def test_redirect_endpoint_suffix():
+    import pytest
+    from assembly import redirect, request
+    from assembly.assembly import AssemblyError
+
+    class RedirectSuffix(Assembly):
+        def index(self):
+            return "index"
+
+        def login(self):
+            return "login"
+
+        @request.post
+        def submit(self):
+            return "submit"
+
+    class RedirectSuffix2(Assembly):
+        def login(self):
+            return "login"
+
+    app = Flask(__name__)
+    RedirectSuffix._register__(app, base_route="/")
+    RedirectSuffix2._register__(app, base_route="/other")
+    with app.test_request_context("/"):
+        assert redirect("RedirectSuffix.login").location == "/login/"
+        assert redirect("RedirectSuffix2.login").location == "/other/login/"
+        with pytest.raises(AssemblyError):
+            redirect("login")
+        assert redirect("static", filename="a.css").location == "/static/a.css"
+
+
+def test_render_stream():
+    import jinja2
+    from assembly import response, set_cookie
+
+    calls = []
+
+    class RenderStream(Assembly):
+        @response.stream
+        def index(self):
+            set_cookie("streamed", "1")
+            return {"items": range(3)}
+
+        def _after_index(self, resp):
+            calls.append(resp.is_streamed)
+            return resp
+
+    app = Flask(__name__)
+    app.jinja_loader = jinja2.DictLoader({
+        "tests/test_assembly_proxy/RenderStream/index.html":
+            "{% for i in items %}<li>{{ i }}</li>{% endfor %}",
+    })
+    RenderStream._register__(app, base_route="/")
+    with app.test_client() as c:
+        resp = c.get("/")
+        assert resp.data == b"<li>0</li><li>1</li><li>2</li>"
+        assert "streamed=1" in resp.headers["Set-Cookie"]
+    assert calls == [True]
+
+
+def test_view_parsers():
+    import json
+    from assembly import response
+
+    def add(name):
+        def parser(data):
+            data.setdefault("parsers", []).append(name)
+            return data
+        return parser
+
+    late = add("late")
+    early = add("early")
+    optin = add("optin")
+    registered = list(Assembly._view_parsers)
+    try:
+        response.view_parser(late, priority=200)
+        response.view_parser(early, priority=1)
+        response.view_parser(optin, auto=False)
+
+        @response.view_parsers(exclude=[late])
+        class ViewParsers(Assembly):
+            @response.json
+            def index(self):
+                return {}
+
+            @response.view_parsers(optin, late)
+            @response.json
+            def all(self):
+                return {}
+
+            @response.view_parsers(exclude=True)
+            @response.json
+            def none(self):
+                return {}
+
+        app = Flask(__name__)
+        ViewParsers._register__(app, base_route="/")
+        with app.test_client() as c:
+            assert json.loads(c.get("/").data)["parsers"] == ["early"]
+            assert json.loads(c.get("/all/").data)["parsers"] == ["early", "optin", "late"]
+            assert "parsers" not in json.loads(c.get("/none/").data)
+    finally:
+        Assembly._view_parsers[:] = registered
+
+
+def test_page_cache():
+    from assembly import response
+    from assembly.assembly import PageCache
+    calls = []
+
+    app = Flask(__name__)
+    app.secret_key = "secret"
+
+    @app.route("/")
+    @response.page_cache(60)
+    def index():
+        calls.append(1)
+        return "page %s" % len(calls)
+
+    @app.route("/cookie")
+    @response.page_cache(60)
+    def cookie():
+        from flask import session
+        session["x"] = 1
+        calls.append(1)
+        return "cookie"
+
+    page_cache = PageCache(app.wsgi_app, skip_cookies=["session"])
+    app.wsgi_app = page_cache
+    c = app.test_client()
+
+    resp = c.get("/?b=2&a=1")
+    assert resp.data == b"page 1"
+    assert "X-Asm-Page-Cache" not in resp.headers
+    assert c.get("/?a=1&b=2").data == b"page 1"
+    assert c.get("/?a=2").data == b"page 2"
+    assert len(calls) == 2
+
+    # responses setting cookies are not saved, requests with the session skip the cache
+    c.get("/cookie")
+    c.get("/cookie")
+    assert len(calls) == 4
+    assert c.get("/?a=1&b=2").data == b"page 5"
+
+    stats = page_cache.stats()
+    assert stats["hits"] == 1
+    assert stats["size"] == 2
+
+
+def test_page_cache_header_and_vary():
+    from assembly import response
+    from assembly.assembly import PageCache
+    calls = []
+
+    app = Flask(__name__)
+
+    @app.route("/")
+    @response.page_cache(60)
+    def index():
+        calls.append(1)
+        return "page"
+
+    @app.route("/lang")
+    @response.page_cache(60)
+    def lang():
+        calls.append(1)
+        return "lang", 200, {"Vary": "Accept-Encoding, Accept-Language"}
+
+    # without the middleware, the internal header is not set
+    c = app.test_client()
+    assert "X-Asm-Page-Cache" not in c.get("/").headers
+
+    app.wsgi_app = PageCache(app.wsgi_app, skip_cookies=["session"])
+    c = app.test_client()
+    c.set_cookie("localhost", "session", "1")
+    assert "X-Asm-Page-Cache" not in c.get("/").headers
+    c.delete_cookie("localhost", "session")
+    assert "X-Asm-Page-Cache" not in c.get("/", headers={"Authorization": "x"}).headers
+
+    # responses varying by other headers than Accept-Encoding are not saved
+    del calls[:]
+    c.get("/lang").data
+    c.get("/lang").data
+    assert len(calls) == 2
+
+
+def test_page_cache_scheme():
+    from flask import url_for
+    from assembly import response
+    from assembly.assembly import PageCache
+
+    app = Flask(__name__)
+
+    @app.route("/")
+    @response.page_cache(60)
+    def index():
+        return url_for("index", _external=True)
+
+    app.wsgi_app = PageCache(app.wsgi_app)
+    c = app.test_client()
+    assert c.get("/").data == b"http://localhost/"
+    assert c.get("/", base_url="https://localhost").data == b"https://localhost/"
+    assert c.get("/", headers={"X-Forwarded-Proto": "https"}).data == b"http://localhost/"
+    assert c.get("/").data == b"http://localhost/"
+
+
+def test_page_cache_purge():
+    from assembly import response
+    from assembly.assembly import PageCache
+
+    app = Flask(__name__)
+
+    @app.route("/<id>")
+    @response.cache_control(surrogate_keys=["post-{id}"])
+    @response.page_cache(60)
+    def post(id):
+        return "post"
+
+    page_cache = PageCache(app.wsgi_app)
+    app.wsgi_app = page_cache
+    c = app.test_client()
+    assert c.get("/1").data == b"post"
+    assert c.get("/2").data == b"post"
+    assert page_cache.stats()["size"] == 2
+    assert page_cache.purge(["post-1"]) == 1
+    assert page_cache.stats()["size"] == 1
+
+
+def test_cors_preflight():
+    from assembly import request
+    from assembly.assembly import CorsPreflight
+    calls = []
+
+    class CorsPreflightView(Assembly):
+        def _before_request(self, name, **kw):
+            calls.append(name)
+
+        @request.cors
+        def index(self):
+            return "ok"
+
+        def private(self):
+            return "private"
+
+    app = Flask(__name__)
+    app.config["CORS_MAX_AGE"] = 600
+    CorsPreflightView._register__(app, base_route="/")
+    app.wsgi_app = CorsPreflight(app.wsgi_app, app, Assembly._cors_preflights)
+    c = app.test_client()
+
+    headers = {"Origin": "http://example.com",
+               "Access-Control-Request-Method": "POST",
+               "Access-Control-Request-Headers": "X-Token"}
+    resp = c.open("/", method="OPTIONS", headers=headers)
+    assert resp.status_code == 200
+    assert resp.headers["Access-Control-Allow-Origin"] == "http://example.com"
+    assert resp.headers["Access-Control-Allow-Headers"] == "X-Token"
+    assert resp.headers["Access-Control-Max-Age"] == "600"
+    assert "POST" in resp.headers["Access-Control-Allow-Methods"]
+    assert "OPTIONS" in resp.headers["Allow"]
+    assert calls == []
+
+    # views without @request.cors go to the app
+    resp = c.open("/private/", method="OPTIONS", headers=headers)
+    assert "Access-Control-Allow-Origin" not in resp.headers
+
+    resp = c.get("/", headers={"Origin": "http://example.com"})
+    assert resp.data == b"ok"
+    assert resp.headers["Access-Control-Allow-Origin"] == "http://example.com"
+    assert calls == ["index"]
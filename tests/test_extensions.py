@@ -0,0 +1,276 @@
+import os
+import jinja2
+from flask import Flask
+from assembly import _extensions
+
+
+def test_templates_cache_filesystem(tmpdir):
+    cache_dir = str(tmpdir.join("templates-cache"))
+    app = Flask(__name__)
+    app.config["TEMPLATES_CACHE"] = {"TYPE": "filesystem", "DIR": cache_dir}
+    app.jinja_loader = jinja2.DictLoader({"index.html": "Hello {{ name }}"})
+    _extensions.setup_templates_cache(app)
+
+    assert isinstance(app.jinja_env.bytecode_cache, jinja2.FileSystemBytecodeCache)
+    assert app.jinja_env.get_template("index.html").render(name="x") == "Hello x"
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_templates_cache_none():
+    app = Flask(__name__)
+    _extensions.setup_templates_cache(app)
+    assert app.jinja_env.bytecode_cache is None
+
+
+def test_fragment_cache():
+    from assembly import response
+    app = Flask(__name__)
+    app.config["CACHE_TYPE"] = "simple"
+    response.caching.init_app(app)
+    _extensions.setup_fragment_cache(app)
+
+    calls = []
+    tpl = app.jinja_env.from_string(
+        '{% cache "menu", 60, user %}<b>{{ load(user) }}</b>{% endcache %}')
+
+    def load(user):
+        calls.append(user)
+        return user
+
+    with app.app_context():
+        before = _extensions.fragment_cache_stats()
+        assert tpl.render(user="a", load=load) == "<b>a</b>"
+        assert tpl.render(user="a", load=load) == "<b>a</b>"
+        assert tpl.render(user="b", load=load) == "<b>b</b>"
+        stats = _extensions.fragment_cache_stats()
+    assert calls == ["a", "b"]
+    assert stats["hits"] - before["hits"] == 1
+    assert stats["misses"] - before["misses"] == 2
+
+
+def test_md_to_html_cache():
+    import threading
+    stats = _extensions.markdown_cache_stats()
+    text = "# Title %s" % id(stats)
+    assert _extensions.md_to_html(text).startswith("<h1")
+    assert _extensions.md_to_html(text).startswith("<h1")
+    after = _extensions.markdown_cache_stats()
+    assert after["hits"] - stats["hits"] == 1
+
+    results = []
+
+    def convert(i):
+        for _ in range(20):
+            results.append(_extensions.md_to_html("**t%s**" % i) == "<p><strong>t%s</strong></p>" % i)
+
+    threads = [threading.Thread(target=convert, args=(i,)) for i in range(8)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    assert all(results)
+
+
+def test_markdown_tag():
+    app = Flask(__name__)
+    _extensions.setup_markdown(app)
+    tpl = app.jinja_env.from_string("{% markdown %}\n    ## Hi\n{% endmarkdown %}")
+    assert tpl.render() == '<h2>Hi</h2>'
+
+
+def test_markdown_tag_static_block():
+    app = Flask(__name__)
+    _extensions.setup_markdown(app)
+    source = "{% markdown %}\n    ## Static\n{% endmarkdown %}"
+    assert "_markdown_support" not in app.jinja_env.compile(source, raw=True)
+    assert app.jinja_env.from_string(source).render() == '<h2>Static</h2>'
+
+    source = "{% markdown %}\n    ## {{ name }}\n{% endmarkdown %}"
+    assert "_markdown_support" in app.jinja_env.compile(source, raw=True)
+    assert app.jinja_env.from_string(source).render(name="Dynamic") == '<h2>Dynamic</h2>'
+
+
+def test_minify_html():
+    html = "<div>\n    <p>a   b</p>\n</div>\n<pre>\n  keep   it\n</pre> <script>var a  = 1;\n</script>"
+    assert _extensions.minify_html(html) == \
+        "<div> <p>a b</p> </div> <pre>\n  keep   it\n</pre> <script>var a  = 1;\n</script>"
+
+
+def test_html_compress_isolated():
+    app = Flask(__name__)
+    app.config["COMPRESS_HTML"] = True
+    _extensions.setup_compress_html(app)
+    tpl = app.jinja_env.from_string("<div>\n   <pre>\n a   b\n</pre>\n   <p>c   d</p></div>")
+    assert tpl.render() == "<div> <pre>\n a   b\n</pre> <p>c d</p></div>"
+
+
+def _placeholder_app():
+    app = Flask(__name__)
+    _extensions.init_app(app)
+    app.jinja_loader = jinja2.DictLoader({
+        "page.html": '<head>{% renderblock "css" %}</head>'
+                     '{% addtoblock "css" %}<link href="{{ css }}">{% endaddtoblock %}'
+                     '{% addtoblock "css" %}<link href="{{ css }}">{% endaddtoblock %}'
+    })
+    return app
+
+
+def test_placeholder_request():
+    from flask import render_template
+    app = _placeholder_app()
+
+    @app.route("/<css>")
+    def page(css):
+        return render_template("page.html", css=css)
+
+    client = app.test_client()
+    assert client.get("/a.css").data == b'<head><link href="a.css"></head>'
+    assert client.get("/b.css").data == b'<head><link href="b.css"></head>'
+
+
+def test_placeholder_threads():
+    from flask import render_template
+    from concurrent.futures import ThreadPoolExecutor
+    app = _placeholder_app()
+    app.jinja_loader.mapping["page.html"] = \
+        '{% addtoblock "css" %}<link href="{{ css }}">{% endaddtoblock %}' \
+        '{% renderblock "css" %}'
+
+    def render(i):
+        with app.app_context():
+            return render_template("page.html", css=i)
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(render, range(200)))
+    assert results == ['<link href="%s">' % i for i in range(200)]
+
+
+def test_placeholder_imported_macro():
+    from flask import render_template
+    app = _placeholder_app()
+    app.jinja_loader.mapping["macros.html"] = \
+        '{% macro picker() %}' \
+        '{% addtoblock "js" %}<script src="/picker.js"></script>{% endaddtoblock %}' \
+        '<input>{% endmacro %}'
+    app.jinja_loader.mapping["page.html"] = \
+        '{% import "macros.html" as m %}<head>{% renderblock "js" %}</head>' \
+        '{{ m.picker() }}<footer>{% renderblock "js" %}</footer>'
+
+    with app.app_context():
+        assert render_template("page.html") == \
+            '<head><script src="/picker.js"></script></head>' \
+            '<input><footer><script src="/picker.js"></script></footer>'
+        # the blocks of a render are not kept for the next one
+        app.jinja_loader.mapping["other.html"] = '{% renderblock "js" %}'
+        assert render_template("other.html") == ''
+
+
+def test_placeholder_preload_links():
+    from flask import render_template
+    app = _placeholder_app()
+    app.config["PRELOAD_LINK_HEADERS"] = True
+    app.jinja_loader.mapping["page.html"] = \
+        '{% addtoblock "css" %}<link rel="stylesheet" href="{{ css }}">{% endaddtoblock %}' \
+        '{% addtoblock "js" %}<script src="/app.js"></script>{% endaddtoblock %}' \
+        '{% addtoblock "js" %}<script>inline()</script>{% endaddtoblock %}' \
+        '{% renderblock "css" %}{% renderblock "js" %}'
+
+    @app.route("/<css>")
+    def page(css):
+        return render_template("page.html", css=css)
+
+    client = app.test_client()
+    for _ in range(2):
+        resp = client.get("/a.css")
+        assert resp.headers["Link"] == \
+            "<a.css>; rel=preload; as=style, </app.js>; rel=preload; as=script"
+    assert _extensions._preload_links_cache.stats()["hits"] >= 1
+    assert "<b.css>" in client.get("/b.css").headers["Link"]
+
+def test_placeholder_fragment_cache():
+    from flask import render_template
+    from assembly import response
+    app = _placeholder_app()
+    app.config["CACHE_TYPE"] = "simple"
+    response.caching.init_app(app)
+    _extensions.setup_fragment_cache(app)
+    app.jinja_loader.mapping["page.html"] = \
+        '{% cache "head" %}<head>{% renderblock "css" %}</head>{% endcache %}' \
+        '{% cache "menu" %}{% addtoblock "css" %}<link href="/menu.css">{% endaddtoblock %}' \
+        '<nav></nav>{% endcache %}' \
+        '{% addtoblock "css" %}<link href="{{ css }}">{% endaddtoblock %}'
+
+    with app.app_context():
+        for css in ("a.css", "b.css"):
+            assert render_template("page.html", css=css) == \
+                '<head><link href="/menu.css">\n<link href="%s"></head><nav></nav>' % css
+        for key in ("head", "menu"):
+            parts, _ = response.caching.get(_extensions.JinjaFragmentCacheExt.key_prefix + key)
+            assert "asm:placeholder" not in "".join(parts)
+
+
+def _compress_app(**config):
+    from assembly import response
+    app = Flask(__name__)
+    app.config["CACHE_TYPE"] = "simple"
+    app.config["COMPRESS_RESPONSE"] = dict({"ENABLED": True}, **config)
+    response.caching.init_app(app)
+    _extensions.setup_compress_response(app)
+    return app
+
+
+def test_compress_response():
+    import gzip
+    import zlib
+    app = _compress_app()
+    body = "hello " * 200
+
+    @app.route("/")
+    def index():
+        return body
+
+    @app.route("/small")
+    def small():
+        return "hi"
+
+    @app.route("/binary")
+    def binary():
+        return app.response_class(body, mimetype="application/octet-stream")
+
+    client = app.test_client()
+    resp = client.get("/", headers={"Accept-Encoding": "gzip, deflate"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    assert gzip.decompress(resp.data).decode() == body
+
+    resp = client.get("/", headers={"Accept-Encoding": "gzip;q=0.5, deflate"})
+    assert zlib.decompress(resp.data).decode() == body
+
+    assert "Content-Encoding" not in client.get("/").headers
+    assert "Content-Encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "Content-Encoding" not in client.get("/binary", headers={"Accept-Encoding": "gzip"}).headers
+
+
+def test_compress_response_cached():
+    from assembly import response
+    app = _compress_app()
+    calls = []
+
+    @app.route("/")
+    @response.cache(60)
+    def index():
+        return "hello " * 200
+
+    real_compress = _extensions._compressors["gzip"]
+
+    def counted(data, level):
+        calls.append(1)
+        return real_compress(data, level)
+
+    _extensions._compressors["gzip"] = counted
+    try:
+        client = app.test_client()
+        first = client.get("/", headers={"Accept-Encoding": "gzip"}).data
+        second = client.get("/", headers={"Accept-Encoding": "gzip"}).data
+    finally:
+        _extensions._compressors["gzip"] = real_compress
+    assert first == second
+    assert len(calls) == 1
@@ -0,0 +1,67 @@
+import pytest
+import flask_caching
+from flask import Flask
+from assembly import Assembly, request
+from assembly.request import (_parse_rate_limit, TokenBucket, CacheCounter,
+                              rate_limiter)
+
+
+def test_parse_rate_limit():
+    assert _parse_rate_limit("100/minute") == (100, 60)
+    assert _parse_rate_limit("10 / second") == (10, 1)
+    assert _parse_rate_limit("1000/6hours") == (1000, 21600)
+    with pytest.raises(ValueError):
+        _parse_rate_limit("100/week")
+
+
+def test_token_bucket():
+    bucket = TokenBucket(maxsize=2)
+    assert bucket.hit("a", 2, 60)[:2] == (True, 1)
+    assert bucket.hit("a", 2, 60)[:2] == (True, 0)
+    allowed, remaining, retry_after = bucket.hit("a", 2, 60)
+    assert not allowed and 0 < retry_after <= 30
+    assert bucket.hit("b", 2, 60)[0]
+
+
+def test_cache_counter():
+    app = Flask(__name__)
+    cache = flask_caching.Cache(app, config={"CACHE_TYPE": "simple"})
+    counter = CacheCounter(cache)
+    with app.app_context():
+        assert counter.hit("a", 2, 60)[:2] == (True, 1)
+        assert counter.hit("a", 2, 60)[:2] == (True, 0)
+        assert not counter.hit("a", 2, 60)[0]
+
+
+def test_rate_limit():
+    calls = []
+
+    @request.rate_limit("2/minute")
+    class RateLimitView(Assembly):
+        def index(self):
+            calls.append("index")
+            return "ok"
+
+        @request.rate_limit("1/minute", key=lambda: f_request.headers.get("X-Key"))
+        def key(self):
+            calls.append("key")
+            return "ok"
+
+    from flask import request as f_request
+    app = Flask(__name__)
+    RateLimitView._register__(app, base_route="/")
+    rate_limiter.store = TokenBucket()
+    c = app.test_client()
+
+    assert c.get("/").headers["X-RateLimit-Remaining"] == "1"
+    assert c.get("/").status_code == 200
+    resp = c.get("/")
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) > 0
+    assert resp.headers["X-RateLimit-Remaining"] == "0"
+    assert calls == ["index", "index"]
+
+    # the class limit applies to each method, and key sets the client
+    assert c.get("/key/", headers={"X-Key": "a"}).status_code == 200
+    assert c.get("/key/", headers={"X-Key": "b"}).status_code == 200
+    assert c.get("/key/", headers={"X-Key": "a"}).status_code == 429
@@ -0,0 +1,426 @@
+import json
+from flask import Flask
+from assembly import response
+
+
+def _app(view):
+    app = Flask(__name__)
+    app.add_url_rule("/", "view", view)
+    return app.test_client()
+
+
+def test_ndjson():
+    rows = ({"id": i} for i in range(250))
+
+    @response.ndjson
+    def view():
+        return rows, 201, {"X-Total": "250"}
+
+    resp = _app(view).get("/")
+    assert resp.status_code == 201
+    assert resp.headers["X-Total"] == "250"
+    assert resp.mimetype == "application/x-ndjson"
+    assert resp.is_streamed
+    lines = resp.get_data(as_text=True).split("\n")
+    assert lines[-1] == ""
+    assert [json.loads(l) for l in lines[:-1]] == [{"id": i} for i in range(250)]
+
+
+def test_ndjson_empty():
+    @response.ndjson
+    def view():
+        return iter([])
+
+    assert _app(view).get("/").data == b""
+
+
+def test_json_stream_generator():
+    @response.json
+    def view():
+        return ({"id": i} for i in range(250))
+
+    resp = _app(view).get("/")
+    assert resp.is_streamed
+    assert resp.mimetype == "application/json"
+    assert json.loads(resp.data) == [{"id": i} for i in range(250)]
+
+    @response.json
+    def empty():
+        return iter([])
+
+    assert json.loads(_app(empty).get("/").data) == []
+
+
+def test_json_stream_same_as_jsonify():
+    import datetime
+    rows = [{"b": datetime.datetime(2020, 1, 2, 3, 4, 5), "a": 1}]
+
+    @response.json
+    def streamed():
+        return iter(rows)
+
+    @response.json
+    def listed():
+        return rows
+
+    @response.ndjson
+    def ndjson():
+        return iter(rows)
+
+    app = Flask(__name__)
+    app.add_url_rule("/streamed", "streamed", streamed)
+    app.add_url_rule("/listed", "listed", listed)
+    app.add_url_rule("/ndjson", "ndjson", ndjson)
+    client = app.test_client()
+    row = b'{"a":1,"b":"Thu, 02 Jan 2020 03:04:05 GMT"}'
+    assert client.get("/listed").data.strip() == b"[" + row + b"]"
+    assert client.get("/streamed").data == b"[" + row + b"]"
+    assert client.get("/ndjson").data == row + b"\n"
+
+
+def test_xml_stream():
+    from dicttoxml import dicttoxml
+
+    @response.xml
+    def view():
+        return {"rows": ({"id": i} for i in range(3))}, {"X-Total": "3"}
+
+    resp = _app(view).get("/")
+    assert resp.is_streamed
+    assert resp.mimetype == "application/xml"
+    assert resp.headers["X-Total"] == "3"
+    assert resp.data == dicttoxml({"rows": [{"id": i} for i in range(3)]})
+
+
+def test_xml_dict_cached():
+    from dicttoxml import dicttoxml
+    calls = []
+
+    @response.xml
+    def view():
+        calls.append(1)
+        return {"name": "assembly"}
+
+    assert not response._xmlify({"name": "assembly"}).is_streamed
+    client = _cache_app(view, timeout=60)
+    resp = client.get("/")
+    assert resp.data == dicttoxml({"name": "assembly"})
+    assert client.get("/").data == resp.data
+    assert len(calls) == 1
+
+
+def _cache_app(view, **kwargs):
+    app = Flask(__name__)
+    app.config["CACHE_TYPE"] = "simple"
+    response.caching.init_app(app)
+    app.add_url_rule("/", "view", response.cache(**kwargs)(view))
+    return app.test_client()
+
+
+def test_cache_vary_by():
+    calls = []
+
+    def view():
+        calls.append(1)
+        return "page %s" % len(calls)
+
+    client = _cache_app(view, timeout=60, vary_by=["args:page", "header:X-Lang"])
+    assert client.get("/?page=1").data == b"page 1"
+    assert client.get("/?page=1&other=1").data == b"page 1"
+    assert client.get("/?page=2").data == b"page 2"
+    assert client.get("/?page=2", headers={"X-Lang": "fr"}).data == b"page 3"
+    assert len(calls) == 3
+
+
+def test_cache_flask_caching_arguments():
+    from flask import request
+    calls = []
+
+    def view():
+        calls.append(1)
+        return "page %s" % len(calls)
+
+    app = Flask(__name__)
+    app.config["CACHE_TYPE"] = "simple"
+    response.caching.init_app(app)
+    # the same positional arguments as flask_caching cached: timeout, key_prefix, unless
+    app.add_url_rule("/unless", "unless",
+                     response.cache(60, "unless", lambda: "nocache" in request.args)(view))
+    app.add_url_rule("/forced", "forced",
+                     response.cache(60, forced_update=lambda: "refresh" in request.args,
+                                    make_cache_key=lambda: "forced")(view))
+    app.add_url_rule("/filter", "filter",
+                     response.cache(60, response_filter=lambda v: v != "page 5")(view))
+    client = app.test_client()
+
+    assert client.get("/unless").data == b"page 1"
+    assert client.get("/unless?nocache=1").data == b"page 2"
+    assert client.get("/unless").data == b"page 1"
+
+    assert client.get("/forced").data == b"page 3"
+    assert client.get("/forced?refresh=1").data == b"page 4"
+    assert client.get("/forced?x=1").data == b"page 4"
+
+    assert client.get("/filter").data == b"page 5"
+    assert client.get("/filter").data == b"page 6"
+    assert client.get("/filter").data == b"page 6"
+
+
+def test_cache_key_prefix_and_unless_arguments():
+    calls = []
+
+    def view(id):
+        calls.append(id)
+        return "post %s" % len(calls)
+
+    app = Flask(__name__)
+    app.config["CACHE_TYPE"] = "simple"
+    response.caching.init_app(app)
+    cached = response.cache(60, key_prefix=lambda: "post",
+                            unless=lambda f, id: id == "nocache")(view)
+    app.add_url_rule("/<id>", "view", cached)
+    client = app.test_client()
+
+    assert cached.uncached is view
+    assert cached.cache_timeout == 60
+    assert client.get("/1").data == b"post 1"
+    # the callable key_prefix gives the same key for all the posts
+    assert client.get("/2").data == b"post 1"
+    assert client.get("/nocache").data == b"post 2"
+
+    # a value saved under the same key by flask_caching cached is a miss
+    with app.app_context():
+        response.caching.set("view//old/1", "old")
+    app.add_url_rule("/old/<id>", "old", response.cache(60)(view))
+    assert client.get("/old/1").data == b"post 3"
+    assert client.get("/old/1").data == b"post 3"
+
+
+def test_cache_backend_error(monkeypatch):
+    calls = []
+
+    def view():
+        calls.append(1)
+        return "page %s" % len(calls)
+
+    client = _cache_app(view, timeout=60)
+
+    def fail(*args, **kwargs):
+        raise ConnectionError("cache down")
+
+    backend = client.application.extensions["cache"][response.caching]
+    for name in ("get", "get_many", "set", "add", "delete"):
+        monkeypatch.setattr(backend, name, fail)
+    assert client.get("/").data == b"page 1"
+    assert client.get("/").data == b"page 2"
+
+
+def test_cache_stale_while_revalidate():
+    import time
+    calls = []
+
+    def view():
+        calls.append(1)
+        return "v%s" % len(calls)
+
+    client = _cache_app(view, timeout=1, stale_while_revalidate=60)
+    assert client.get("/").data == b"v1"
+    time.sleep(1.1)
+    # stale is served, refreshed in the background
+    assert client.get("/").data == b"v1"
+    for _ in range(50):
+        if client.get("/").data == b"v2":
+            break
+        time.sleep(0.02)
+    assert client.get("/").data == b"v2"
+    assert len(calls) == 2
+
+
+def test_cache_dogpile():
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    calls = []
+
+    def view():
+        calls.append(1)
+        time.sleep(0.2)
+        return "done"
+
+    client = _cache_app(view, timeout=60)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: client.get("/").data, range(8)))
+    assert results == [b"done"] * 8
+    assert len(calls) == 1
+
+
+def test_conditional_body_etag():
+    @response.conditional
+    def view():
+        return "hello"
+
+    client = _app(view)
+    resp = client.get("/")
+    etag = resp.headers["ETag"]
+    assert resp.data == b"hello"
+    resp = client.get("/", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.data == b""
+    assert client.get("/", headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_conditional_version():
+    import datetime
+    calls = []
+    modified = datetime.datetime(2020, 1, 2, 3, 4, 5)
+
+    @response.conditional(version=lambda: "v1", last_modified=lambda: modified)
+    def view():
+        calls.append(1)
+        return "hello"
+
+    client = _app(view)
+    resp = client.get("/")
+    etag = resp.headers["ETag"]
+    assert resp.headers["Last-Modified"] == "Thu, 02 Jan 2020 03:04:05 GMT"
+    assert len(calls) == 1
+
+    resp = client.get("/", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.headers["ETag"] == etag
+    resp = client.get("/", headers={"If-Modified-Since": "Thu, 02 Jan 2020 03:04:05 GMT"})
+    assert resp.status_code == 304
+    assert len(calls) == 1
+
+    assert client.get("/", headers={"If-Modified-Since": "Wed, 01 Jan 2020 00:00:00 GMT"}).status_code == 200
+    assert len(calls) == 2
+
+
+def test_cache_control():
+    @response.cache_control(public=True, max_age=60, s_maxage=300, no_cache=False,
+                            surrogate_keys=["posts", "post-{id}", lambda id: ["a", "b"]])
+    def view(id):
+        return "post"
+
+    app = Flask(__name__)
+    app.add_url_rule("/<id>", "view", view)
+    resp = app.test_client().get("/1")
+    assert resp.headers["Cache-Control"] == "public, max-age=60, s-maxage=300"
+    assert resp.headers["Surrogate-Key"] == "a b post-1 posts"
+
+    try:
+        response.cache_control(maxage=1)
+        assert False
+    except TypeError:
+        pass
+
+
+def test_cache_control_errors_and_str_key():
+    from flask import abort
+
+    @response.cache_control(public=True, s_maxage=3600, surrogate_keys="post-{id}")
+    def view(id):
+        if id == "0":
+            abort(404)
+        return "post"
+
+    app = Flask(__name__)
+    app.add_url_rule("/<id>", "view", view)
+    client = app.test_client()
+    resp = client.get("/12")
+    assert resp.headers["Cache-Control"] == "public, s-maxage=3600"
+    assert resp.headers["Surrogate-Key"] == "post-12"
+    resp = client.get("/0")
+    assert resp.status_code == 404
+    assert "Cache-Control" not in resp.headers
+    assert "Surrogate-Key" not in resp.headers
+
+
+def test_purge():
+    calls = []
+
+    @response.cache_control(surrogate_keys=["post-{id}"])
+    @response.cache(60)
+    def view(id):
+        calls.append(id)
+        return "post %s" % len(calls)
+
+    app = Flask(__name__)
+    app.config["CACHE_TYPE"] = "simple"
+    response.caching.init_app(app)
+    app.add_url_rule("/<id>", "view", view)
+    client = app.test_client()
+
+    assert client.get("/1").data == b"post 1"
+    assert client.get("/2").data == b"post 2"
+    assert client.get("/1").data == b"post 1"
+    with app.app_context():
+        response.purge("post-1")
+    assert client.get("/1").data == b"post 3"
+    assert client.get("/2").data == b"post 2"
+    assert client.get("/1").data == b"post 3"
+
+
+def test_purge_after_refresh():
+    import time
+    calls = []
+
+    @response.cache_control(surrogate_keys=["post-{id}"])
+    @response.cache(1, stale_while_revalidate=60)
+    def view(id):
+        calls.append(id)
+        return "post %s" % len(calls)
+
+    app = Flask(__name__)
+    app.config["CACHE_TYPE"] = "simple"
+    response.caching.init_app(app)
+    app.add_url_rule("/<id>", "view", view)
+    client = app.test_client()
+
+    assert client.get("/1").data == b"post 1"
+    time.sleep(1.1)
+    # stale is served, refreshed in the background with the surrogate keys
+    assert client.get("/1").data == b"post 1"
+    for _ in range(50):
+        if len(calls) == 2:
+            break
+        time.sleep(0.02)
+    assert client.get("/1").data == b"post 2"
+    with app.app_context():
+        response.purge("post-1")
+        # the purge marks expire
+        assert 0 < response._get_purge_timeout() <= response.PURGE_MAX_TIMEOUT
+    assert client.get("/1").data == b"post 3"
+
+
+def test_jsonify_format():
+    import arrow
+    import datetime
+    import dataclasses
+    from flask import jsonify
+    from assembly import utils
+
+    @dataclasses.dataclass
+    class Point(object):
+        x: int
+
+    data = {
+        "arrow": arrow.get("2020-01-02T03:04:05+00:00"),
+        "datetime": datetime.datetime(2020, 1, 2, 3, 4, 5),
+        "date": datetime.date(2020, 1, 2),
+        "point": Point(1)
+    }
+    expected = {
+        "arrow": "2020-01-02T03:04:05+00:00",
+        "datetime": "Thu, 02 Jan 2020 03:04:05 GMT",
+        "date": "Thu, 02 Jan 2020 00:00:00 GMT",
+        "point": {"x": 1}
+    }
+    app = Flask(__name__)
+    backends = ["stdlib"] + (["orjson"] if utils.orjson else [])
+    try:
+        for backend in backends:
+            utils.set_json_backend(backend)
+            with app.app_context():
+                assert json.loads(jsonify(data).data) == expected
+    finally:
+        utils.set_json_backend("stdlib")
@@ -180,4 +180,62 @@ def test_prepare_view_response():
     assert len(result) == 3
     assert isinstance(result[0], dict)
     assert result[1] is 202
-    assert result[2] is not None     
\ No newline at end of file
+    assert result[2] is not None     
+
+def test_lru_cache():
+    cache = utils.LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1 and stats["size"] == 2
+    cache.resize(1)
+    assert len(cache) == 1
+
+
+def test_json_dumps():
+    import arrow
+    import datetime
+    data = {
+        "arrow": arrow.get("2020-01-02T03:04:05+00:00"),
+        "datetime": datetime.datetime(2020, 1, 2, 3, 4, 5),
+        "date": datetime.date(2020, 1, 2),
+        "list": [1, "a"]
+    }
+    expected = {
+        "arrow": "2020-01-02T03:04:05+00:00",
+        "datetime": "2020-01-02T03:04:05Z",
+        "date": "2020-01-02",
+        "list": [1, "a"]
+    }
+    backends = ["stdlib"] + (["orjson"] if utils.orjson else [])
+    try:
+        for backend in backends:
+            utils.set_json_backend(backend)
+            assert utils.json.loads(utils.to_json(data)) == expected
+    finally:
+        utils.set_json_backend("stdlib")
+
+    try:
+        utils.set_json_backend("yaml")
+        assert False
+    except ValueError:
+        pass
+
+
+def test_to_xml():
+    import datetime
+    from dicttoxml import dicttoxml
+    data = {
+        "a": 1, "b": "x<&>", "c": [1, {"d": None}, True, [2]], "1 bad": 2,
+        "e": {"f": False, "g": 1.5}, "h": datetime.date(2020, 1, 1), 1: "one"
+    }
+    for d in [data, [1, data], "s", None]:
+        assert utils.to_xml(d) == dicttoxml(d).decode("utf-8")
+    assert utils.to_xml({"g": (i for i in range(2))}) == dicttoxml({"g": [0, 1]}).decode("utf-8")
+    chunks = list(utils.iter_xml([{"id": i} for i in range(5000)], chunk_size=1024))
+    assert len(chunks) > 1
+    assert "".join(chunks) == dicttoxml([{"id": i} for i in range(5000)]).decode("utf-8")